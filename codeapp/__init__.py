@@ -8,12 +8,23 @@ from flask import Flask
 from flask_bcrypt import Bcrypt
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-from flask_login import LoginManager
+from flask_login import LoginManager, user_logged_in, user_logged_out
 from flask_sqlalchemy import SQLAlchemy
 
 # app imports
+from codeapp import admission
+from codeapp.database import (
+    EXTENSION_KEY,
+    JOBS_BIND_KEY,
+    SESSIONS_BIND_KEY,
+    ReplicaSet,
+    RoutingSession,
+    replica_bind_keys,
+)
+from codeapp.sharding import EXTENSION_KEY as SHARD_EXTENSION_KEY
+from codeapp.sharding import ShardSet, shard_bind_keys
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 bcrypt = Bcrypt()
 login_manager = LoginManager()
 login_manager.login_view = "bp.login"
@@ -58,7 +69,9 @@ dictConfig(
 )
 
 
-def create_app(app_settings: Optional[str] = None) -> Flask:
+def create_app(  # pylint: disable=too-many-statements
+    app_settings: Optional[str] = None,
+) -> Flask:
     app: Flask = Flask(__name__)
 
     if app_settings is None:
@@ -83,7 +96,56 @@ def create_app(app_settings: Optional[str] = None) -> Flask:
             "SQLALCHEMY_DATABASE_URI"
         ].replace("postgres://", "postgresql://")
 
+    # read-only replicas are registered as extra binds,
+    # so that Flask-SQLAlchemy creates and disposes their engines
+    replica_uris = [
+        uri.replace("postgres://", "postgresql://")
+        for uri in app.config.get("SQLALCHEMY_REPLICA_URIS", [])
+    ]
+    replica_binds = replica_bind_keys(replica_uris)
+    # the same goes for the shards of the sharded tables
+    shard_uris = [
+        uri.replace("postgres://", "postgresql://")
+        for uri in app.config.get("SQLALCHEMY_SHARD_URIS", [])
+    ]
+    shard_binds = shard_bind_keys(shard_uris)
+    # and for the separate database of the job queue, if any
+    jobs_binds: Dict[str, str] = {}
+    if app.config.get("JOBS_DATABASE_URI"):
+        jobs_binds[JOBS_BIND_KEY] = app.config["JOBS_DATABASE_URI"].replace(
+            "postgres://", "postgresql://"
+        )
+    # and for the separate database of the sessions, if any
+    sessions_binds: Dict[str, str] = {}
+    if app.config.get("SESSION_DATABASE_URI"):
+        sessions_binds[SESSIONS_BIND_KEY] = app.config[
+            "SESSION_DATABASE_URI"
+        ].replace("postgres://", "postgresql://")
+    if replica_binds or shard_binds or jobs_binds or sessions_binds:
+        app.config["SQLALCHEMY_BINDS"] = {
+            **app.config.get("SQLALCHEMY_BINDS", {}),
+            **replica_binds,
+            **shard_binds,
+            **jobs_binds,
+            **sessions_binds,
+        }
+
     db.init_app(app)
+
+    if replica_binds:
+        with app.app_context():
+            app.extensions[EXTENSION_KEY] = ReplicaSet(
+                [db.engines[key] for key in replica_binds],
+                health_interval=app.config[
+                    "SQLALCHEMY_REPLICA_HEALTH_INTERVAL"
+                ],
+                pin_seconds=app.config["SQLALCHEMY_REPLICA_PIN_SECONDS"],
+            )
+    if shard_binds:
+        with app.app_context():
+            app.extensions[SHARD_EXTENSION_KEY] = ShardSet(
+                [db.engines[key] for key in shard_binds]
+            )
     # the code below activates stricter handling foreign keys
     if (
         app.config["SQLALCHEMY_DATABASE_URI"] is not None
@@ -98,6 +160,18 @@ def create_app(app_settings: Optional[str] = None) -> Flask:
         with app.app_context():
             event.listen(db.engine, "connect", _fk_pragma_on_connect)
 
+    # the admission control runs before anything else in the request
+    if app.config["ADMISSION_MAX_IN_FLIGHT"] > 0:
+        app.extensions[admission.EXTENSION_KEY] = admission.AdmissionController(
+            min(
+                app.config["ADMISSION_MAX_IN_FLIGHT"], app.config["WEB_THREADS"]
+            ),
+            app.config["ADMISSION_SHARES"],
+            app.config["ADMISSION_TARGET_LATENCY"],
+        )
+        app.before_request(admission.before_request)
+        app.teardown_request(admission.teardown_request)
+
     bcrypt.init_app(app)
     login_manager.init_app(app)
     limiter.init_app(app)
@@ -107,6 +181,70 @@ def create_app(app_settings: Optional[str] = None) -> Flask:
 
     app.register_blueprint(bp)
 
+    # background job queue
+    from codeapp import jobs  # pylint: disable=import-outside-toplevel
+
+    with app.app_context():
+        jobs_engine = db.engines[JOBS_BIND_KEY] if jobs_binds else db.engine
+        app.extensions[jobs.EXTENSION_KEY] = jobs.JobQueue(
+            jobs_engine,
+            backoff_base=app.config["JOBS_BACKOFF_BASE"],
+            backoff_max=app.config["JOBS_BACKOFF_MAX"],
+            visibility_timeout=app.config["JOBS_VISIBILITY_TIMEOUT"],
+        )
+        if jobs_binds:
+            # the separate database only holds the `job` table
+            app.extensions[jobs.EXTENSION_KEY].table.create(
+                jobs_engine, checkfirst=True
+            )
+
+    # server-side sessions
+    from codeapp import sessions  # pylint: disable=import-outside-toplevel
+
+    with app.app_context():
+        sessions_engine = (
+            db.engines[SESSIONS_BIND_KEY] if sessions_binds else db.engine
+        )
+        app.extensions[sessions.EXTENSION_KEY] = sessions.SessionStore(
+            sessions_engine,
+            cache_size=app.config["SESSION_CACHE_SIZE"],
+            cleanup_interval=app.config["SESSION_CLEANUP_INTERVAL"],
+        )
+        if sessions_binds:
+            # the separate database only holds the `server_session` table
+            app.extensions[sessions.EXTENSION_KEY].table.create(
+                sessions_engine, checkfirst=True
+            )
+    app.session_interface = sessions.ServerSideSessionInterface()
+    user_logged_in.connect(sessions.regenerate_session, app)
+    user_logged_out.connect(sessions.regenerate_session, app)
+
+    # login history and last-seen times, written in batches
+    from codeapp import activity  # pylint: disable=import-outside-toplevel
+
+    with app.app_context():
+        app.extensions[activity.EXTENSION_KEY] = activity.ActivityBuffer(
+            db.engine,
+            [db.engines[key] for key in shard_binds],
+            flush_interval=app.config["ACTIVITY_FLUSH_INTERVAL"],
+            coalesce_window=app.config["ACTIVITY_COALESCE_WINDOW"],
+            max_pending=app.config["ACTIVITY_MAX_PENDING"],
+        )
+    user_logged_in.connect(activity.record_login, app)
+    app.before_request(activity.touch_current_user)
+
+    # profiling of single live requests, guarded by a token
+    if app.config["PROFILE_REQUEST_TOKEN"]:
+        from codeapp import profiling  # pylint: disable=import-outside-toplevel
+
+        app.wsgi_app = profiling.ProfilerMiddleware(  # type: ignore[method-assign]
+            app.wsgi_app,
+            app.config["PROFILE_REQUEST_TOKEN"],
+            app.config["PROFILE_DIR"]
+            or os.path.join(app.instance_path, "profiles"),
+            mode=app.config["PROFILE_MODE"],
+        )
+
     # shell context for flask cli
     @app.shell_context_processor
     def ctx() -> Dict[str, object]:  # pragma: no cover
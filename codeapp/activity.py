@@ -0,0 +1,196 @@
+# pylint: disable=cyclic-import
+"""
+Login history and last-seen tracking, written in batches.
+
+Writing a `LoginEvent` on every login and updating `User.last_seen_at`
+on every request would add one or more writes to each request. Instead,
+`ActivityBuffer` keeps them in memory and writes them with a single
+multi-row `INSERT` and one `UPDATE` per shard, every
+`ACTIVITY_FLUSH_INTERVAL` seconds, when `ACTIVITY_MAX_PENDING` items
+are waiting, and when the process exits.
+
+A user seen again within `ACTIVITY_COALESCE_WINDOW` seconds of the last
+written time is not written again, so an active user costs one update
+per window, however many requests they make.
+"""
+
+# python built-in imports
+import atexit
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+# python external imports
+from flask import current_app, has_app_context, request
+from flask_login import current_user
+from sqlalchemy import bindparam, insert, or_, update
+from sqlalchemy.engine import Engine
+
+# app imports
+from codeapp.models import LoginEvent, SessionUser, User
+
+# key under which the `ActivityBuffer` is stored in `app.extensions`
+EXTENSION_KEY = "activity"
+
+logger = logging.getLogger(__name__)
+
+# (shard, local id) of a user
+UserKey = Tuple[Optional[int], int]
+
+
+class ActivityBuffer:  # pylint: disable=too-many-instance-attributes
+    def __init__(
+        self,
+        engine: Engine,
+        shard_engines: Optional[List[Engine]] = None,
+        flush_interval: float = 5.0,
+        coalesce_window: float = 60.0,
+        max_pending: int = 1000,
+    ) -> None:
+        self.engine = engine
+        self.shard_engines = shard_engines or []
+        self.flush_interval = flush_interval
+        self.coalesce_window = coalesce_window
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._events: List[Dict[str, object]] = []
+        # last-seen times waiting to be written, by user
+        self._seen: Dict[UserKey, float] = {}
+        # last-seen times already written (or pending), by user
+        self._written: Dict[UserKey, float] = {}
+        self._stopped = threading.Event()
+        # the process that started the timer, as workers are forked
+        self._pid: Optional[int] = None
+
+    def record_login(
+        self, user: SessionUser, ip: Optional[str], user_agent: str
+    ) -> None:
+        now = time.time()
+        self._start()
+        with self._lock:
+            self._events.append(
+                {
+                    "user_id": user.get_id(),
+                    "created_at": now,
+                    "ip": ip,
+                    "user_agent": user_agent[:255],
+                }
+            )
+        self.touch(user, now)
+
+    def touch(self, user: SessionUser, now: Optional[float] = None) -> None:
+        """Marks `user` as seen, unless it was within the window."""
+        now = time.time() if now is None else now
+        key = (user.shard, user.id)
+        with self._lock:
+            if now - self._written.get(key, 0.0) < self.coalesce_window:
+                return
+            self._written[key] = now
+            self._seen[key] = now
+            full = len(self._events) + len(self._seen) >= self.max_pending
+        self._start()
+        if full:
+            self.flush()
+
+    def flush(self) -> int:
+        """Writes everything pending. Returns the number of items written."""
+        with self._lock:
+            events, self._events = self._events, []
+            seen, self._seen = self._seen, {}
+            # users out of the window can be forgotten
+            limit = time.time() - self.coalesce_window
+            self._written = {
+                key: at for key, at in self._written.items() if at > limit
+            }
+        if events:
+            events_table = LoginEvent.__table__  # type: ignore[attr-defined]
+            with self.engine.begin() as conn:
+                conn.execute(insert(events_table), events)
+        by_shard: Dict[Optional[int], List[Dict[str, object]]] = {}
+        for (shard, user_id), at in seen.items():
+            by_shard.setdefault(shard, []).append({"_id": user_id, "_at": at})
+        table = User.__table__
+        stmt = (
+            update(table)
+            .where(table.c.id == bindparam("_id"))
+            # several processes may flush in any order
+            .where(
+                or_(
+                    table.c.last_seen_at.is_(None),
+                    table.c.last_seen_at < bindparam("_at"),
+                )
+            )
+            .values(last_seen_at=bindparam("_at"))
+        )
+        for shard, rows in by_shard.items():
+            engine = self.engine if shard is None else self.shard_engines[shard]
+            with engine.begin() as conn:
+                conn.execute(stmt, rows)
+        return len(events) + len(seen)
+
+    def move_user(self, old_id: str, new_id: str) -> None:
+        """
+        Points the login history of a user at its new id, e.g., after
+        `rebalance_shards()` moved it to another shard.
+        """
+        self.flush()
+        table = LoginEvent.__table__  # type: ignore[attr-defined]
+        with self.engine.begin() as conn:
+            conn.execute(
+                update(table)
+                .where(table.c.user_id == old_id)
+                .values(user_id=new_id)
+            )
+
+    def stop(self) -> None:
+        """Stops the timer and writes what is pending."""
+        self._stopped.set()
+        self.flush()
+
+    def _start(self) -> None:
+        """Starts the timer once per process, on first use."""
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        atexit.register(self.stop)
+        if self.flush_interval > 0:
+            threading.Thread(
+                target=self._run, name="activity-flush", daemon=True
+            ).start()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:  # pylint: disable=broad-except
+                # the items are lost, but the timer keeps running
+                logger.exception(e)
+
+
+def get_activity_buffer() -> Optional[ActivityBuffer]:
+    if not has_app_context():
+        return None
+    buffer: Optional[ActivityBuffer] = current_app.extensions.get(EXTENSION_KEY)
+    return buffer
+
+
+def record_login(_: object, user: SessionUser) -> None:
+    """Receiver of the `user_logged_in` signal of Flask-Login."""
+    buffer = get_activity_buffer()
+    if buffer is not None:
+        buffer.record_login(
+            user, request.remote_addr, request.user_agent.string
+        )
+
+
+def touch_current_user() -> None:
+    """Run before each request, except the ones for static files."""
+    buffer = get_activity_buffer()
+    if (
+        buffer is not None
+        and request.endpoint != "static"
+        and current_user.is_authenticated
+    ):
+        buffer.touch(current_user)
@@ -0,0 +1,163 @@
+"""
+Adaptive admission control, to shed load before the workers fall over.
+
+Requests are split in classes: `static` files, anonymous `page` views,
+`user` pages viewed by a logged user, `auth` routes (login and
+registration, which hash passwords) and other `write` requests.
+Each class has a concurrency limit that adapts to its recent latency:
+it shrinks while the latency is over the target of the class and grows
+back once it is not. On top of that, a class can only use
+a share of `ADMISSION_MAX_IN_FLIGHT`, so that the most expensive classes
+are shed first when the process is saturated.
+
+A shed request gets an immediate `503` with a `Retry-After` header,
+instead of waiting in line until it times out.
+Counts are per process, so they only matter with threaded workers, and
+`ADMISSION_MAX_IN_FLIGHT` is capped at the `WEB_THREADS` of the process.
+"""
+
+# python built-in imports
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Mapping, Optional
+
+# python external imports
+from flask import Response, current_app, g, request, session
+from flask_login import COOKIE_NAME
+
+# key under which the controller is stored in `app.extensions`
+EXTENSION_KEY = "admission"
+
+# endpoints that verify or hash passwords
+AUTH_ENDPOINTS = frozenset(
+    {"bp.login", "bp.register", "bp.api_login", "bp.api_register"}
+)
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+
+@dataclass
+class ClassState:
+    # current concurrency limit, adapted with the latency
+    limit: float
+    # highest value the limit can grow back to
+    max_limit: float
+    # latency above which the limit shrinks, in seconds
+    target_latency: float
+    in_flight: int = 0
+    # exponentially weighted moving average of the latency, in seconds
+    latency: float = 0.0
+
+
+class AdmissionController:
+    """In-flight requests and latency of each class, shared by the threads."""
+
+    def __init__(
+        self,
+        max_in_flight: int,
+        shares: Mapping[str, float],
+        target_latency: Mapping[str, float],
+        min_limit: int = 1,
+    ) -> None:
+        self.max_in_flight = max_in_flight
+        self.shares = dict(shares)
+        self.min_limit = min_limit
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self.classes: Dict[str, ClassState] = {}
+        for name, share in self.shares.items():
+            max_limit = max(float(min_limit), share * max_in_flight)
+            self.classes[name] = ClassState(
+                limit=max_limit,
+                max_limit=max_limit,
+                target_latency=target_latency[name],
+            )
+
+    def acquire(self, name: str) -> bool:
+        """Counts the request in, unless its class is over a limit."""
+        with self._lock:
+            state = self.classes[name]
+            if state.in_flight >= int(state.limit):
+                return False
+            if self.in_flight >= self.shares[name] * self.max_in_flight:
+                return False
+            state.in_flight += 1
+            self.in_flight += 1
+            return True
+
+    def release(self, name: str, latency: float) -> None:
+        """Counts the request out and adapts the limit of its class."""
+        with self._lock:
+            state = self.classes[name]
+            state.in_flight -= 1
+            self.in_flight -= 1
+            state.latency = 0.8 * state.latency + 0.2 * latency
+            # additive increase, multiplicative decrease
+            if state.latency > state.target_latency:
+                state.limit = max(float(self.min_limit), state.limit * 0.9)
+            else:
+                state.limit = min(state.max_limit, state.limit + 1)
+
+
+def get_admission_controller() -> Optional[AdmissionController]:
+    controller: Optional[AdmissionController] = current_app.extensions.get(
+        EXTENSION_KEY
+    )
+    return controller
+
+
+def classify() -> str:
+    if request.endpoint == "static":
+        return "static"
+    if request.endpoint in AUTH_ENDPOINTS:
+        return "auth"
+    if request.method not in SAFE_METHODS:
+        return "write"
+    # tells logged users apart without loading them from the database
+    remember_cookie = current_app.config.get(
+        "REMEMBER_COOKIE_NAME", COOKIE_NAME
+    )
+    if "_user_id" in session or remember_cookie in request.cookies:
+        return "user"
+    return "page"
+
+
+def queued_too_long(name: str) -> bool:
+    """
+    Uses the `X-Request-Start` header set by the router (e.g., Heroku),
+    in milliseconds since the epoch, to tell how long the request waited
+    before reaching the app. Static files are never shed because of it.
+    """
+    header = request.headers.get("X-Request-Start", "")
+    if name == "static" or not header.isdigit():
+        return False
+    queued = time.time() - int(header) / 1000
+    return bool(queued > current_app.config["ADMISSION_MAX_QUEUE_TIME"])
+
+
+def before_request() -> Optional[Response]:
+    controller = get_admission_controller()
+    if controller is None:
+        return None
+    name = classify()
+    if queued_too_long(name) or not controller.acquire(name):
+        current_app.logger.warning(f"Shedding {name} request: {request.path}")
+        response = Response(
+            "The service is overloaded. Please try again shortly.",
+            status=503,
+            mimetype="text/plain",
+        )
+        response.headers["Retry-After"] = str(
+            current_app.config["ADMISSION_RETRY_AFTER"]
+        )
+        return response
+    g.admission = (name, time.monotonic())
+    return None
+
+
+def teardown_request(_: Optional[BaseException]) -> None:
+    admitted = g.pop("admission", None)
+    controller = get_admission_controller()
+    if admitted is not None and controller is not None:
+        name, start = admitted
+        controller.release(name, time.monotonic() - start)
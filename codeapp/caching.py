@@ -0,0 +1,82 @@
+"""
+Conditional responses for pages that only depend on the logged user.
+
+A view decorated with `@conditional_user_page` gets a private `ETag` built from the
+user id, the version of the user row, the URL with its query string
+and a hash of the templates.
+When the browser sends the same `ETag` back in `If-None-Match`,
+the view is not called and an empty `304 Not Modified` is returned.
+"""
+
+# python built-in imports
+import hashlib
+import os
+from functools import wraps
+from typing import Callable, Union
+
+# python external imports
+from flask import Response, current_app, request, session
+from flask_login import current_user
+from werkzeug.wrappers.response import Response as WerkzeugResponse
+
+# key under which the templates hash is stored in `app.extensions`
+EXTENSION_KEY = "templates_hash"
+
+ViewResponse = Union[str, Response, WerkzeugResponse]
+View = Callable[..., ViewResponse]  # type: ignore[explicit-any]
+
+
+def templates_hash() -> str:
+    """
+    Hash of the content of every template, computed once per process.
+    In debug mode, it is recomputed so that edited templates show up.
+    """
+    cached: str = current_app.extensions.get(EXTENSION_KEY, "")
+    if cached and not current_app.debug:
+        return cached
+    digest = hashlib.sha1()
+    folder = os.path.join(
+        current_app.root_path, str(current_app.template_folder)
+    )
+    for root, _, files in sorted(os.walk(folder)):
+        for name in sorted(files):
+            with open(os.path.join(root, name), "rb") as file:
+                digest.update(file.read())
+    current_app.extensions[EXTENSION_KEY] = digest.hexdigest()
+    return digest.hexdigest()
+
+
+def user_etag() -> str:
+    parts = [
+        current_user.get_id(),
+        str(current_user.version),
+        request.full_path,
+        templates_hash(),
+    ]
+    return hashlib.sha1(":".join(parts).encode("utf-8")).hexdigest()
+
+
+def conditional_user_page(view: View) -> View:
+    """
+    Must be placed below `@login_required`.
+    Pages with pending flashed messages are not cached,
+    since the messages are shown only once.
+    """
+
+    @wraps(view)
+    def wrapper(*args: object, **kwargs: object) -> ViewResponse:
+        if "_flashes" in session:
+            return view(*args, **kwargs)
+        etag = user_etag()
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = current_app.make_response(view(*args, **kwargs))
+        response.set_etag(etag)
+        # the page must be revalidated every time, and only by the browser
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        response.vary.add("Cookie")
+        return response
+
+    return wrapper
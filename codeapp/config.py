@@ -1,13 +1,100 @@
 import os
+from typing import List, Optional
+
+
+def _env_list(name: str) -> List[str]:
+    """Reads a comma-separated list from the environment variable `name`."""
+    return [
+        item.strip() for item in os.getenv(name, "").split(",") if item.strip()
+    ]
 
 
 class BaseConfig:
     TESTING = False
     SECRET_KEY = ""  # TODO: paste here a secret key.
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # sessions are stored on the server, see `codeapp.sessions`.
+    # `SESSION_PERMANENT` makes new sessions outlive the browser, and
+    # `SESSION_USE_SIGNER` signs the session id in the cookie
     SESSION_PERMANENT = False
     SESSION_USE_SIGNER = True
+    # database of the sessions, e.g., a SQLite file local to the server.
+    # when `None`, sessions are stored in `SQLALCHEMY_DATABASE_URI`
+    SESSION_DATABASE_URI: Optional[str] = None
+    # sessions kept in memory by each process
+    SESSION_CACHE_SIZE = 1024
+    # seconds between two deletions of the expired sessions
+    SESSION_CLEANUP_INTERVAL = 300.0
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # read-only replicas of `SQLALCHEMY_DATABASE_URI`.
+    # when empty, all statements go to the primary database
+    SQLALCHEMY_REPLICA_URIS: List[str] = []
+    # seconds before a failing replica is tried again
+    SQLALCHEMY_REPLICA_HEALTH_INTERVAL = 30.0
+    # seconds during which a client keeps reading from the primary
+    # after a write, so that it can read its own writes
+    SQLALCHEMY_REPLICA_PIN_SECONDS = 5.0
+    # databases holding the rows of the sharded tables (e.g., `user`).
+    # when empty, these tables live in `SQLALCHEMY_DATABASE_URI`
+    SQLALCHEMY_SHARD_URIS: List[str] = []
+    # database of the background job queue.
+    # when `None`, jobs are stored in `SQLALCHEMY_DATABASE_URI`
+    JOBS_DATABASE_URI: Optional[str] = None
+    # a failed job waits `JOBS_BACKOFF_BASE ** attempts` seconds,
+    # up to `JOBS_BACKOFF_MAX`, before being tried again
+    JOBS_BACKOFF_BASE = 2.0
+    JOBS_BACKOFF_MAX = 600.0
+    # seconds after which a running job is considered abandoned
+    JOBS_VISIBILITY_TIMEOUT = 300.0
+    # threads of each web process, passed to `gunicorn --threads` in the
+    # `Procfile`. a process never handles more requests than this at once
+    WEB_THREADS = int(os.getenv("WEB_THREADS", "8"))
+    # requests handled at the same time by one process before shedding.
+    # it is capped at `WEB_THREADS`, since it could never be reached above.
+    # set it to 0 to disable the admission control
+    ADMISSION_MAX_IN_FLIGHT = WEB_THREADS
+    # share of `ADMISSION_MAX_IN_FLIGHT` each class of request can use,
+    # so that the most expensive classes are shed first
+    ADMISSION_SHARES = {
+        "auth": 0.5,
+        "write": 0.7,
+        "user": 0.9,
+        "page": 0.9,
+        "static": 1.0,
+    }
+    # latency, in seconds, above which the limit of a class shrinks
+    ADMISSION_TARGET_LATENCY = {
+        "auth": 1.0,
+        "write": 0.5,
+        "user": 0.5,
+        "page": 0.25,
+        "static": 0.1,
+    }
+    # seconds a shed client is asked to wait before trying again
+    ADMISSION_RETRY_AFTER = 2
+    # requests that waited longer than this, in seconds, in the router
+    # queue are shed, since the client has likely given up already
+    ADMISSION_MAX_QUEUE_TIME = 10.0
+    # seconds between two writes of the login history and last-seen times.
+    # with 0, they are only written when `ACTIVITY_MAX_PENDING` items
+    # are waiting and when the process exits
+    ACTIVITY_FLUSH_INTERVAL = 5.0
+    # a user seen again within this many seconds is not written again
+    ACTIVITY_COALESCE_WINDOW = 60.0
+    ACTIVITY_MAX_PENDING = 1000
+    # requests sent with the `X-Profile` header set to this value are
+    # profiled. when `None`, no request is profiled
+    PROFILE_REQUEST_TOKEN: Optional[str] = None
+    # `sample`, for collapsed stacks, or `cprofile`, for `.prof` files
+    PROFILE_MODE = "sample"
+    # where the profiles are stored. when `None`, in `instance/profiles`
+    PROFILE_DIR: Optional[str] = None
+    # backfills of `manage.py migrate` update this many rows at a time,
+    # waiting `MIGRATION_BATCH_PAUSE` seconds between batches
+    MIGRATION_BATCH_SIZE = 1000
+    MIGRATION_BATCH_PAUSE = 0.1
+    # seconds a schema change waits for its lock before failing (PostgreSQL)
+    MIGRATION_LOCK_TIMEOUT = 5.0
 
 
 class DevelopmentConfig(BaseConfig):
@@ -22,9 +109,47 @@ class TestingConfig(BaseConfig):
     # disables checking of CSRF for testing
     # more info: https://flask-wtf.readthedocs.io/en/1.0.x/config/
     WTF_CSRF_ENABLED = False
+    # the tests flush the activity themselves
+    ACTIVITY_FLUSH_INTERVAL = 0.0
+
+
+class TestingReplicaConfig(TestingConfig):
+    # a second SQLite file, kept in sync with `manage.py sync_replicas`
+    SQLALCHEMY_REPLICA_URIS = ["sqlite:///site-testing-replica.db"]
+
+
+class TestingShardConfig(TestingConfig):
+    # the `user` table is spread across two SQLite files
+    SQLALCHEMY_SHARD_URIS = [
+        "sqlite:///site-testing-shard-0.db",
+        "sqlite:///site-testing-shard-1.db",
+    ]
+
+
+class TestingMigrationConfig(TestingConfig):
+    # an empty database, built only by the migrations
+    SQLALCHEMY_DATABASE_URI = "sqlite:///site-testing-migrations.db"
+    MIGRATION_BATCH_SIZE = 2
+    MIGRATION_BATCH_PAUSE = 0.0
+
+
+class TestingSessionConfig(TestingConfig):
+    # sessions in their own SQLite file
+    SESSION_DATABASE_URI = "sqlite:///site-testing-sessions.db"
+    SESSION_CACHE_SIZE = 1
+
+
+class TestingProfileConfig(TestingConfig):
+    # requests sent with `X-Profile: testing` are profiled
+    PROFILE_REQUEST_TOKEN = "testing"
 
 
 class ProductionConfig(BaseConfig):
     SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL")
+    SQLALCHEMY_REPLICA_URIS = _env_list("DATABASE_REPLICA_URLS")
+    SQLALCHEMY_SHARD_URIS = _env_list("DATABASE_SHARD_URLS")
+    JOBS_DATABASE_URI = os.getenv("JOBS_DATABASE_URL")
+    SESSION_DATABASE_URI = os.getenv("SESSION_DATABASE_URL")
+    PROFILE_REQUEST_TOKEN = os.getenv("PROFILE_REQUEST_TOKEN")
     SECRET_KEY = os.getenv("FLASK_SECRET_KEY") or ""
     SQLALCHEMY_ECHO = False
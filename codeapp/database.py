@@ -0,0 +1,226 @@
+"""
+Database session layer that routes read-only statements to replicas.
+
+Writes (and everything that is not a plain `SELECT`) go to the primary
+database configured in `SQLALCHEMY_DATABASE_URI`.
+Plain `SELECT` statements go to one of the replicas listed in
+`SQLALCHEMY_REPLICA_URIS`, unless the request already wrote something,
+in which case it stays on the primary to read its own writes.
+Rows of sharded tables are written to their shard (see `codeapp.sharding`).
+"""
+
+# python built-in imports
+import itertools
+import sqlite3
+import time
+from typing import Dict, Iterator, List, Optional
+
+# python external imports
+from flask import current_app, has_app_context, has_request_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.sql import Select
+
+# app imports
+from codeapp.sharding import SHARD_KEY, get_shard_set
+
+# key under which the `ReplicaSet` is stored in `app.extensions`
+EXTENSION_KEY = "replicas"
+# prefix of the keys added to `SQLALCHEMY_BINDS` for each replica
+BIND_PREFIX = "replica_"
+# bind of the separate job queue database, see `codeapp.jobs`
+JOBS_BIND_KEY = "jobs"
+# bind of the separate session database, see `codeapp.sessions`
+SESSIONS_BIND_KEY = "sessions"
+# key stored in the flask session to keep reading from the primary
+# for a few seconds after a write, even across redirects
+PIN_SESSION_KEY = "_db_primary_until"
+
+
+class ReplicaSet:
+    """
+    Keeps the replica engines of one application and their health.
+    A replica that fails is skipped until `health_interval` seconds
+    have passed, after which it is pinged again before being used.
+    """
+
+    def __init__(
+        self,
+        engines: List[Engine],
+        health_interval: float = 30.0,
+        pin_seconds: float = 5.0,
+    ) -> None:
+        self.engines = engines
+        self.health_interval = health_interval
+        self.pin_seconds = pin_seconds
+        self._down_since: Dict[int, float] = {}
+        self._cycle: Iterator[int] = itertools.cycle(range(len(engines)))
+        for engine in engines:
+            event.listen(engine, "handle_error", self._on_error)
+
+    def _on_error(self, context: object) -> None:
+        engine = getattr(context, "engine", None)
+        if engine is not None:
+            self.mark_down(engine)
+
+    def mark_down(self, engine: Engine) -> None:
+        for idx, _engine in enumerate(self.engines):
+            if _engine is engine and idx not in self._down_since:
+                self._down_since[idx] = time.monotonic()
+                current_app.logger.warning(f"Replica {idx} marked as down.")
+
+    def is_healthy(self, idx: int) -> bool:
+        down_since = self._down_since.get(idx)
+        if down_since is None:
+            return True
+        if time.monotonic() - down_since < self.health_interval:
+            return False
+        # the cool-down passed, so the replica is pinged once more
+        try:
+            with self.engines[idx].connect() as conn:
+                conn.execute(text("SELECT 1"))
+        except DBAPIError:
+            self._down_since[idx] = time.monotonic()
+            return False
+        # another thread may have brought it back already
+        self._down_since.pop(idx, None)
+        return True
+
+    def choose(self) -> Optional[Engine]:
+        """Returns the next healthy replica in round-robin order, if any."""
+        for _ in range(len(self.engines)):
+            idx = next(self._cycle)
+            if self.is_healthy(idx):
+                return self.engines[idx]
+        return None
+
+
+def get_replica_set() -> Optional[ReplicaSet]:
+    if not has_app_context():
+        return None
+    replicas: Optional[ReplicaSet] = current_app.extensions.get(EXTENSION_KEY)
+    return replicas
+
+
+class RoutingSession(Session):
+    """
+    `db.session` class that sends plain `SELECT` statements to a replica
+    and everything else to the primary.
+    """
+
+    _pinned_to_primary = False
+    _routed_replica: Optional[Engine] = None
+
+    def __init__(self, db, **kwargs):  # type: ignore[no-untyped-def]
+        super().__init__(db, **kwargs)
+        if get_shard_set() is not None:
+            # makes each flushed row go to the connection of its shard
+            setattr(self, "connection_callable", self._connection_for_instance)
+
+    def _connection_for_instance(  # type: ignore[no-untyped-def]
+        self, mapper, instance
+    ):
+        engine = self.get_bind(mapper)  # type: ignore[no-untyped-call]
+        shard_key = mapper.local_table.info.get(SHARD_KEY)
+        shards = get_shard_set()
+        if shard_key is not None and shards is not None:
+            engine = shards.engine_for(getattr(instance, shard_key))
+        return self._connection_for_bind(engine, None)
+
+    def get_bind(  # type: ignore[no-untyped-def]
+        self, mapper=None, clause=None, bind=None, **kwargs
+    ):
+        engine = super().get_bind(
+            mapper=mapper, clause=clause, bind=bind, **kwargs
+        )
+        replicas = get_replica_set()
+        if (
+            replicas is None
+            or bind is not None
+            or engine is not self._db.engines.get(None)
+        ):
+            return engine
+        if self._flushing or not _is_read_only(clause):
+            self.pin_to_primary()
+            return engine
+        if self._is_pinned():
+            return engine
+        replica = replicas.choose()
+        if replica is None:
+            return engine
+        self._routed_replica = replica
+        return replica
+
+    def execute(  # type: ignore[no-untyped-def]
+        self, statement, *args, **kwargs
+    ):
+        self._routed_replica = None
+        try:
+            return super().execute(statement, *args, **kwargs)
+        except DBAPIError:
+            replica = self._routed_replica
+            replicas = get_replica_set()
+            if replica is None or replicas is None or self._has_changes():
+                raise
+            # the replica failed: it is skipped from now on,
+            # and the statement is repeated against the primary, not
+            # against the next replica, which may be failing as well
+            replicas.mark_down(replica)
+            self.rollback()
+            self._routed_replica = None
+            self._pinned_to_primary = True
+            return super().execute(statement, *args, **kwargs)
+
+    def pin_to_primary(self) -> None:
+        self._pinned_to_primary = True
+        replicas = get_replica_set()
+        if replicas is not None and has_request_context():
+            session[PIN_SESSION_KEY] = time.time() + replicas.pin_seconds
+
+    def _is_pinned(self) -> bool:
+        if self._pinned_to_primary:
+            return True
+        if has_request_context():
+            pinned_until: float = session.get(PIN_SESSION_KEY, 0.0)
+            return pinned_until > time.time()
+        return False
+
+    def _has_changes(self) -> bool:
+        return bool(self.new or self.dirty or self.deleted)
+
+
+def _is_read_only(clause: object) -> bool:
+    return (
+        isinstance(clause, Select)
+        and getattr(clause, "_for_update_arg", None) is None
+    )
+
+
+def replica_bind_keys(uris: List[str]) -> Dict[str, str]:
+    """Returns the entries to add to `SQLALCHEMY_BINDS` for the replicas."""
+    return {f"{BIND_PREFIX}{idx}": uri for idx, uri in enumerate(uris)}
+
+
+def sync_sqlite_replicas() -> int:
+    """
+    Copies the SQLite primary database over its SQLite replicas.
+    This stands in for real replication during development and testing.
+    Returns the number of replicas copied.
+    """
+    replicas = get_replica_set()
+    primary = current_app.extensions["sqlalchemy"].engines[None]
+    if replicas is None or primary.url.get_backend_name() != "sqlite":
+        return 0
+    copied = 0
+    with sqlite3.connect(str(primary.url.database)) as source:
+        for engine in replicas.engines:
+            if engine.url.get_backend_name() != "sqlite":
+                continue  # pragma: no cover
+            # connections to the old file must not be reused
+            engine.dispose()
+            with sqlite3.connect(str(engine.url.database)) as target:
+                source.backup(target)
+            copied += 1
+    return copied
@@ -17,74 +17,90 @@ from wtforms.validators import (
 
 from codeapp import db
 from codeapp.models import User
+from codeapp.sharding import shard_bind_arguments, shard_for_email
 
 # useful links:
 # WTForms fields: https://wtforms.readthedocs.io/en/3.0.x/fields/
 # WTForms validators: https://wtforms.readthedocs.io/en/3.0.x/validators/
 
 
+# the validators below are shared by the forms and by the JSON schemas
+# in `codeapp.schemas`, so that both paths apply the same rules
+LOGIN_VALIDATORS = {
+    "email": [
+        # this field must be filled
+        DataRequired(),
+        # this field must have at least 5 characters
+        Length(min=5),
+    ],
+    "password": [
+        # this field must be filled
+        DataRequired(),
+        # this field needs to have at least 5 characters
+        Length(min=5),
+    ],
+}
+
+REGISTRATION_VALIDATORS = {
+    "name": [
+        # this field must be filled
+        DataRequired(),
+        # the name must have 2-20 characters
+        Length(min=2, max=20),
+    ],
+    "email": [
+        # the user must fill this field
+        DataRequired(),
+        # validate as an email
+        Email(),
+    ],
+    "password": [DataRequired()],
+    "confirm_password": [
+        # user must fill the `confirm password`
+        DataRequired(),
+        # the value here must be equal to the `password`
+        EqualTo("password"),
+    ],
+}
+
+
+def check_email_not_registered(email: str) -> None:
+    # only the key is needed to know whether the email is taken
+    _stmt = select(User.id).where(User.email == email).limit(1)
+    _user_id = db.session.execute(
+        _stmt,
+        bind_arguments=shard_bind_arguments(shard_for_email(email)),
+    ).scalar()
+    if _user_id is not None:
+        # if a user exists with this email,
+        # you cannot create a second user using it.
+        # By raising an error, the message is shown to the user.
+        raise ValidationError(
+            "This email is already registered. "
+            "Please choose a different one."
+        )
+
+
 class LoginForm(FlaskForm):
-    email = EmailField(
-        "E-mail",
-        validators=[
-            # this field must be filled
-            DataRequired(),
-            # this field must have at least 5 characters
-            Length(min=5),
-        ],
-    )
+    email = EmailField("E-mail", validators=LOGIN_VALIDATORS["email"])
     password = PasswordField(
-        "Password",
-        validators=[
-            # this field must be filled
-            DataRequired(),
-            # this field needs to have at least 5 characters
-            Length(min=5),
-        ],
+        "Password", validators=LOGIN_VALIDATORS["password"]
     )
     remember = BooleanField("Remember Me")
     submit = SubmitField("Login")
 
 
 class RegistrationForm(FlaskForm):
-    name = StringField(
-        "Name",
-        validators=[
-            # this field must be filled
-            DataRequired(),
-            # the name must have 2-20 characters
-            Length(min=2, max=20),
-        ],
-    )
-    email = EmailField(
-        "Email",
-        validators=[
-            # the user must fill this field
-            DataRequired(),
-            # validate as an email
-            Email(),
-        ],
+    name = StringField("Name", validators=REGISTRATION_VALIDATORS["name"])
+    email = EmailField("Email", validators=REGISTRATION_VALIDATORS["email"])
+    password = PasswordField(
+        "Password", validators=REGISTRATION_VALIDATORS["password"]
     )
-    password = PasswordField("Password", validators=[DataRequired()])
     confirm_password = PasswordField(
         "Confirm Password",
-        validators=[
-            # user must fill the `confirm password`
-            DataRequired(),
-            # the value here must be equal to the `password`
-            EqualTo("password"),
-        ],
+        validators=REGISTRATION_VALIDATORS["confirm_password"],
     )
     submit = SubmitField("Sign Up")
 
     def validate_email(self, email: EmailField) -> None:
-        _stmt = select(User).where(User.email == email.data).limit(1)
-        _user = db.session.execute(_stmt).scalars().first()
-        if _user:
-            # if a user exists with this email,
-            # you cannot create a second user using it.
-            # By raising an error, the message is shown to the user.
-            raise ValidationError(
-                "This email is already registered. "
-                "Please choose a different one."
-            )
+        check_email_not_registered(email.data)
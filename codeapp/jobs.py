@@ -0,0 +1,266 @@
+# pylint: disable=cyclic-import
+"""
+Small persistent job queue for work that does not need to happen
+before the response is sent, e.g., sending the welcome e-mail.
+
+Functions decorated with `@job` can be called directly, or queued with
+`.delay(**kwargs)`. Queued jobs are stored in the `job` table, either in
+the app database or in `JOBS_DATABASE_URI`, and are run by one or more
+`manage.py worker` processes. A job that raises is retried with an
+exponential backoff until it reaches its maximum number of attempts.
+"""
+
+# python built-in imports
+import json
+import time
+from typing import Callable, Dict, Optional
+
+# python external imports
+from flask import current_app
+from sqlalchemy import insert, select, update
+from sqlalchemy.engine import Engine
+
+# app imports
+from codeapp import db
+from codeapp.models import Job
+
+# key under which the `JobQueue` is stored in `app.extensions`
+EXTENSION_KEY = "jobs"
+
+JobCallable = Callable[..., None]  # type: ignore[explicit-any]
+
+# functions that can be run by the workers, by name
+registry: Dict[str, "JobFunction"] = {}
+
+
+class JobFunction:
+    """Wraps a function decorated with `@job`."""
+
+    def __init__(self, func: JobCallable, max_attempts: int) -> None:
+        self.func = func
+        self.name = f"{func.__module__}.{func.__qualname__}"
+        self.max_attempts = max_attempts
+        self.__doc__ = func.__doc__
+
+    def __call__(self, **kwargs: object) -> None:
+        self.func(**kwargs)
+
+    def delay(self, countdown: float = 0.0, **kwargs: object) -> int:
+        """
+        Queues the function to be run by a worker, with `kwargs`,
+        after `countdown` seconds. Returns the id of the job.
+        """
+        return get_job_queue().enqueue(
+            self.name, kwargs, self.max_attempts, countdown
+        )
+
+
+def job(max_attempts: int = 5) -> Callable[[JobCallable], JobFunction]:
+    """
+    Registers a function to be run in the background.
+    Its arguments must be passed by keyword and be JSON serializable.
+    """
+
+    def decorator(func: JobCallable) -> JobFunction:
+        job_function = JobFunction(func, max_attempts)
+        registry[job_function.name] = job_function
+        return job_function
+
+    return decorator
+
+
+class JobQueue:
+    def __init__(
+        self,
+        engine: Engine,
+        backoff_base: float = 2.0,
+        backoff_max: float = 600.0,
+        visibility_timeout: float = 300.0,
+    ) -> None:
+        self.engine = engine
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.visibility_timeout = visibility_timeout
+        self.table = Job.__table__  # type: ignore[attr-defined]
+
+    def enqueue(
+        self,
+        name: str,
+        kwargs: Dict[str, object],
+        max_attempts: int = 5,
+        countdown: float = 0.0,
+    ) -> int:
+        with self.engine.begin() as conn:
+            result = conn.execute(
+                insert(self.table).values(
+                    name=name,
+                    payload=json.dumps(kwargs),
+                    status="queued",
+                    attempts=0,
+                    max_attempts=max_attempts,
+                    run_at=time.time() + countdown,
+                )
+            )
+        (job_id,) = result.inserted_primary_key or (0,)
+        current_app.logger.debug(f"Job {job_id} ({name}) queued.")
+        return int(job_id)
+
+    def claim(self) -> Optional[Job]:
+        """
+        Marks the next due job as running and returns it.
+        The conditional `UPDATE` makes sure that only one worker gets it,
+        without relying on row locks that SQLite does not have.
+        """
+        table = self.table
+        while True:
+            now = time.time()
+            with self.engine.begin() as conn:
+                row = (
+                    conn.execute(
+                        select(table)
+                        .where(table.c.status == "queued")
+                        .where(table.c.run_at <= now)
+                        .order_by(table.c.run_at)
+                        .limit(1)
+                    )
+                    .mappings()
+                    .first()
+                )
+                if row is None:
+                    return None
+                claimed = conn.execute(
+                    update(table)
+                    .where(table.c.id == row["id"])
+                    .where(table.c.status == "queued")
+                    .values(
+                        status="running",
+                        attempts=table.c.attempts + 1,
+                        locked_at=now,
+                    )
+                ).rowcount
+            if claimed == 1:
+                _job = Job(
+                    name=row["name"],
+                    payload=row["payload"],
+                    status="running",
+                    attempts=row["attempts"] + 1,
+                    max_attempts=row["max_attempts"],
+                    run_at=row["run_at"],
+                    locked_at=now,
+                )
+                _job.id = row["id"]
+                return _job
+            # another worker claimed it first: tries the next one
+
+    def complete(self, _job: Job) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(
+                update(self.table)
+                .where(self.table.c.id == _job.id)
+                .values(status="done", locked_at=None)
+            )
+
+    def fail(self, _job: Job, error: str) -> None:
+        """Queues the job again with a backoff, or marks it as failed."""
+        values: Dict[str, object] = {"locked_at": None, "last_error": error}
+        if _job.attempts < _job.max_attempts:
+            values["status"] = "queued"
+            values["run_at"] = time.time() + self.backoff(_job.attempts)
+        else:
+            values["status"] = "failed"
+        with self.engine.begin() as conn:
+            conn.execute(
+                update(self.table)
+                .where(self.table.c.id == _job.id)
+                .values(**values)
+            )
+
+    def backoff(self, attempts: int) -> float:
+        """Seconds to wait before the next attempt."""
+        return float(
+            min(self.backoff_max, self.backoff_base ** max(attempts, 1))
+        )
+
+    def requeue_stale(self) -> int:
+        """
+        Queues again the jobs left running by a worker that died, or marks
+        them as failed once they reached their maximum number of attempts.
+        Returns the number of jobs queued again.
+        """
+        table = self.table
+        stale = (table.c.status == "running") & (
+            table.c.locked_at < time.time() - self.visibility_timeout
+        )
+        with self.engine.begin() as conn:
+            conn.execute(
+                update(table)
+                .where(stale)
+                .where(table.c.attempts >= table.c.max_attempts)
+                .values(
+                    status="failed",
+                    locked_at=None,
+                    last_error="Abandoned by its worker.",
+                )
+            )
+            result = conn.execute(
+                update(table)
+                .where(stale)
+                .values(status="queued", locked_at=None)
+            )
+        return int(result.rowcount)
+
+
+def get_job_queue() -> JobQueue:
+    queue: JobQueue = current_app.extensions[EXTENSION_KEY]
+    return queue
+
+
+def run_job(_job: Job) -> bool:
+    """Runs one claimed job. Returns whether it succeeded."""
+    queue = get_job_queue()
+    job_function = registry.get(_job.name)
+    try:
+        if job_function is None:
+            raise LookupError(f"No job function named `{_job.name}`.")
+        job_function(**json.loads(_job.payload))
+    except Exception as e:
+        current_app.logger.exception(e)
+        queue.fail(_job, f"{type(e).__name__}: {e}")
+        return False
+    finally:
+        # the next job starts with a clean session, even if this one
+        # left a failed transaction behind
+        db.session.remove()
+    queue.complete(_job)
+    return True
+
+
+class Worker:
+    """Loop run by `manage.py worker`."""
+
+    def __init__(self, poll_interval: float = 1.0, burst: bool = False):
+        self.poll_interval = poll_interval
+        # in burst mode, the worker stops once the queue is empty
+        self.burst = burst
+        self.running = False
+
+    def stop(self, *_: object) -> None:
+        self.running = False
+
+    def run(self) -> int:
+        """Returns the number of jobs run."""
+        queue = get_job_queue()
+        self.running = True
+        count = 0
+        queue.requeue_stale()
+        while self.running:
+            _job = queue.claim()
+            if _job is None:
+                if self.burst:
+                    break
+                time.sleep(self.poll_interval)
+                queue.requeue_stale()
+                continue
+            run_job(_job)
+            count += 1
+        return count
@@ -0,0 +1,368 @@
+# pylint: disable=cyclic-import
+"""
+Versioned schema migrations, run by `manage.py migrate` on release.
+
+Each module of this package named `v<version>_<name>.py` holds one
+migration, with an `upgrade(ctx)` function and a docstring describing
+it. Migrations run in the order of their versions, and the applied
+ones are recorded in the `schema_migration` table. The tables of a
+migration are defined in the module itself, as they were at that
+version, so that the models can keep changing.
+
+The operations of `MigrationContext` can be run again safely, so that a
+migration interrupted halfway can be resumed:
+- tables, columns and indexes are only created when missing;
+- indexes are created `CONCURRENTLY` on PostgreSQL, without locking
+  writes to the table;
+- backfills update rows in small batches, each in its own transaction,
+  pausing between them, and record their progress in
+  `migration_progress` to continue where they stopped.
+"""
+
+# python built-in imports
+import importlib
+import pkgutil
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Set
+
+# python external imports
+from flask import current_app
+from sqlalchemy import (
+    Column,
+    Float,
+    Index,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    insert,
+    inspect,
+    select,
+    text,
+    update,
+)
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.sql import ColumnElement
+
+# app imports
+from codeapp import db
+from codeapp.jobs import get_job_queue
+from codeapp.sessions import get_session_store
+from codeapp.sharding import get_shard_set, sharded_tables
+
+# the bookkeeping tables are not part of the models,
+# so that `db.drop_all()` and `db.create_all()` leave them alone
+metadata = MetaData()
+
+schema_migration = Table(
+    "schema_migration",
+    metadata,
+    Column("version", String(32), primary_key=True),
+    Column("name", String(255), nullable=False),
+    # seconds since the epoch
+    Column("applied_at", Float(), nullable=False),
+)
+
+migration_progress = Table(
+    "migration_progress",
+    metadata,
+    # `<version>:<table>:<engine index>`
+    Column("key", String(255), primary_key=True),
+    # last primary key processed by the backfill
+    Column("cursor", Integer(), nullable=False),
+)
+
+Where = Callable[[Table], ColumnElement[bool]]
+
+
+class Migration(NamedTuple):
+    version: str
+    name: str
+    description: str
+    upgrade: Callable[["MigrationContext"], None]
+
+
+class MigrationContext:
+    """Operations available to the `upgrade()` of a migration."""
+
+    def __init__(
+        self,
+        version: str,
+        batch_size: int = 1000,
+        pause: float = 0.1,
+        lock_timeout: float = 5.0,
+        echo: Callable[[str], None] = print,
+    ) -> None:
+        self.version = version
+        self.batch_size = batch_size
+        self.pause = pause
+        self.lock_timeout = lock_timeout
+        self.echo = echo
+
+    @staticmethod
+    def engines_for(table_name: str) -> List[Engine]:
+        """Engines holding `table_name`: its shards, its own DB or the app DB."""
+        shards = get_shard_set()
+        if shards is not None and table_name in {
+            table.name for table in sharded_tables(db.metadata)
+        }:
+            return shards.engines
+        if table_name == "job":
+            return [get_job_queue().engine]
+        if table_name == "server_session":
+            return [get_session_store(current_app).engine]
+        return [db.engine]
+
+    def _set_lock_timeout(self, conn: Connection) -> None:
+        """
+        Makes DDL give up instead of queueing every other statement
+        behind it while it waits for its lock.
+        """
+        if conn.dialect.name == "postgresql":  # pragma: no cover
+            milliseconds = int(self.lock_timeout * 1000)
+            conn.execute(text(f"SET LOCAL lock_timeout = '{milliseconds}ms'"))
+
+    def create_table(self, table: Table) -> None:
+        """Creates `table` and its indexes, if missing."""
+        for engine in self.engines_for(table.name):
+            with engine.begin() as conn:
+                self._set_lock_timeout(conn)
+                table.create(conn, checkfirst=True)
+
+    def add_column(
+        self, table_name: str, column: Column  # type: ignore[type-arg]
+    ) -> None:
+        """
+        Adds `column`, if missing. It should be nullable or have a
+        constant `server_default`, so that rows are not rewritten.
+        """
+        for engine in self.engines_for(table_name):
+            with engine.begin() as conn:
+                existing = {
+                    info["name"]
+                    for info in inspect(conn).get_columns(table_name)
+                }
+                if column.name in existing:
+                    continue
+                self._set_lock_timeout(conn)
+                preparer = conn.dialect.identifier_preparer
+                ddl = CreateColumn(column).compile(dialect=conn.dialect)
+                conn.execute(
+                    text(
+                        f"ALTER TABLE {preparer.quote(table_name)} "
+                        f"ADD COLUMN {ddl}"
+                    )
+                )
+
+    def create_index(
+        self, table: Table, name: str, *columns: str, unique: bool = False
+    ) -> None:
+        """
+        Creates an index, if missing. On PostgreSQL, it is built
+        `CONCURRENTLY`, outside of a transaction, so that writes go on.
+        """
+        # built on a copy, so that the table of the migration is unchanged
+        copy = table.to_metadata(MetaData())
+        index = Index(
+            name,
+            *(copy.c[column] for column in columns),
+            unique=unique,
+            postgresql_concurrently=True,
+        )
+        for engine in self.engines_for(table.name):
+            with engine.connect() as conn:
+                conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+                if conn.dialect.name == "postgresql":  # pragma: no cover
+                    _drop_invalid_index(conn, name)
+                index.create(conn, checkfirst=True)
+
+    def backfill(
+        self,
+        table: Table,
+        values: Dict[str, object],
+        where: Optional[Where] = None,
+    ) -> int:
+        """
+        Sets `values` on the rows matching `where`, in batches of
+        `batch_size` rows by primary key, pausing between them.
+        Since a batch can be run twice after an interruption, `values`
+        must give the same result when applied again.
+        Returns the number of rows updated.
+        """
+        (pk,) = table.primary_key.columns
+        updated = 0
+        for idx, engine in enumerate(self.engines_for(table.name)):
+            key = f"{self.version}:{table.name}:{idx}"
+            cursor = self._cursor(key)
+            while True:
+                with engine.begin() as conn:
+                    stmt = select(pk).where(pk > cursor).order_by(pk)
+                    if where is not None:
+                        stmt = stmt.where(where(table))
+                    ids = (
+                        conn.execute(stmt.limit(self.batch_size))
+                        .scalars()
+                        .all()
+                    )
+                    if not ids:
+                        break
+                    updated += conn.execute(
+                        update(table).where(pk.in_(ids)).values(**values)
+                    ).rowcount
+                cursor = ids[-1]
+                self._save_cursor(key, cursor)
+                self.echo(f"  {table.name}: {updated} row(s) updated")
+                time.sleep(self.pause)
+        return updated
+
+    @staticmethod
+    def _cursor(key: str) -> int:
+        with db.engine.connect() as conn:
+            cursor: Optional[int] = conn.execute(
+                select(migration_progress.c.cursor).where(
+                    migration_progress.c.key == key
+                )
+            ).scalar()
+        return cursor or 0
+
+    @staticmethod
+    def _save_cursor(key: str, cursor: int) -> None:
+        with db.engine.begin() as conn:
+            saved = conn.execute(
+                update(migration_progress)
+                .where(migration_progress.c.key == key)
+                .values(cursor=cursor)
+            ).rowcount
+            if not saved:
+                conn.execute(
+                    insert(migration_progress).values(key=key, cursor=cursor)
+                )
+
+
+def _drop_invalid_index(
+    conn: Connection, name: str
+) -> None:  # pragma: no cover
+    """A concurrent build that failed leaves an invalid index behind."""
+    invalid = conn.execute(
+        text(
+            "SELECT NOT indisvalid FROM pg_index "
+            "WHERE indexrelid = to_regclass(:name)"
+        ),
+        {"name": name},
+    ).scalar()
+    if invalid:
+        quoted = conn.dialect.identifier_preparer.quote(name)
+        conn.execute(text(f"DROP INDEX CONCURRENTLY {quoted}"))
+
+
+def load_migrations() -> List[Migration]:
+    """Returns the migrations of this package, in order."""
+    migrations = []
+    for module_info in pkgutil.iter_modules(__path__):
+        prefix, _, name = module_info.name.partition("_")
+        module = importlib.import_module(f"{__name__}.{module_info.name}")
+        migrations.append(
+            Migration(
+                version=prefix.lstrip("v"),
+                name=name,
+                description=(module.__doc__ or "").strip(),
+                upgrade=module.upgrade,
+            )
+        )
+    return sorted(migrations, key=lambda migration: int(migration.version))
+
+
+def applied_versions() -> Set[str]:
+    metadata.create_all(db.engine, checkfirst=True)
+    with db.engine.connect() as conn:
+        return set(conn.execute(select(schema_migration.c.version)).scalars())
+
+
+def pending_migrations() -> List[Migration]:
+    applied = applied_versions()
+    return [
+        migration
+        for migration in load_migrations()
+        if migration.version not in applied
+    ]
+
+
+def _record(migration: Migration) -> None:
+    with db.engine.begin() as conn:
+        conn.execute(
+            insert(schema_migration).values(
+                version=migration.version,
+                name=migration.name,
+                applied_at=time.time(),
+            )
+        )
+        conn.execute(
+            migration_progress.delete().where(
+                migration_progress.c.key.startswith(f"{migration.version}:")
+            )
+        )
+
+
+def migrate(echo: Callable[[str], None] = print) -> List[str]:
+    """Applies the pending migrations. Returns their versions."""
+    config = current_app.config
+    applied = []
+    for migration in pending_migrations():
+        echo(f"Applying {migration.version} {migration.name}...")
+        migration.upgrade(
+            MigrationContext(
+                migration.version,
+                batch_size=config["MIGRATION_BATCH_SIZE"],
+                pause=config["MIGRATION_BATCH_PAUSE"],
+                lock_timeout=config["MIGRATION_LOCK_TIMEOUT"],
+                echo=echo,
+            )
+        )
+        _record(migration)
+        applied.append(migration.version)
+    return applied
+
+
+def stamp() -> int:
+    """
+    Records every migration as applied, without running it, e.g.,
+    after creating the tables from the models with `db.create_all()`.
+    Returns the number of migrations recorded.
+    """
+    pending = pending_migrations()
+    for migration in pending:
+        _record(migration)
+    return len(pending)
+
+
+def schema_drift() -> List[str]:
+    """
+    Compares the models with the database and returns what is missing,
+    e.g., a column added to a model without a migration.
+    """
+    problems = []
+    for table in db.metadata.sorted_tables:
+        for idx, engine in enumerate(MigrationContext.engines_for(table.name)):
+            where = f"{table.name} (engine {idx})"
+            inspector = inspect(engine)
+            if not inspector.has_table(table.name):
+                problems.append(f"missing table {where}")
+                continue
+            columns = {
+                info["name"] for info in inspector.get_columns(table.name)
+            }
+            problems.extend(
+                f"missing column {column.name} in {where}"
+                for column in table.c
+                if column.name not in columns
+            )
+            indexes = {
+                info["name"] for info in inspector.get_indexes(table.name)
+            }
+            problems.extend(
+                f"missing index {index.name} in {where}"
+                for index in table.indexes
+                if index.name not in indexes
+            )
+    return problems
@@ -0,0 +1,55 @@
+"""Creates the `user` and `job` tables, and `user.version` if missing."""
+
+# python external imports
+from sqlalchemy import (
+    Column,
+    Float,
+    Index,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    Text,
+)
+
+# app imports
+from codeapp.migrations import MigrationContext
+
+metadata = MetaData()
+
+user = Table(
+    "user",
+    metadata,
+    Column("id", Integer(), primary_key=True, autoincrement=True),
+    Column("name", String(128), nullable=False),
+    Column("email", String(128), unique=True, nullable=False),
+    Column("password", String(128), nullable=False),
+    Column("version", Integer(), nullable=False, server_default="1"),
+    sqlite_autoincrement=True,
+)
+
+job = Table(
+    "job",
+    metadata,
+    Column("id", Integer(), primary_key=True, autoincrement=True),
+    Column("name", String(255), nullable=False),
+    Column("payload", Text(), nullable=False),
+    Column("status", String(16), nullable=False),
+    Column("attempts", Integer(), nullable=False),
+    Column("max_attempts", Integer(), nullable=False),
+    Column("run_at", Float(), nullable=False),
+    Column("locked_at", Float(), nullable=True),
+    Column("last_error", Text(), nullable=True),
+    Index("ix_job_status_run_at", "status", "run_at"),
+)
+
+
+def upgrade(ctx: MigrationContext) -> None:
+    ctx.create_table(user)
+    # databases built by `recreate_db` before the column was added
+    # already have the table, without it
+    ctx.add_column(
+        "user",
+        Column("version", Integer(), nullable=False, server_default="1"),
+    )
+    ctx.create_table(job)
@@ -0,0 +1,31 @@
+"""Adds `user.last_seen_at` and the `login_event` table."""
+
+# python external imports
+from sqlalchemy import Column, Float, Integer, MetaData, String, Table
+
+# app imports
+from codeapp.migrations import MigrationContext
+
+metadata = MetaData()
+
+login_event = Table(
+    "login_event",
+    metadata,
+    Column("id", Integer(), primary_key=True, autoincrement=True),
+    Column("user_id", String(32), nullable=False),
+    Column("created_at", Float(), nullable=False),
+    Column("ip", String(45), nullable=True),
+    Column("user_agent", String(255), nullable=True),
+)
+
+
+def upgrade(ctx: MigrationContext) -> None:
+    # nullable, so existing rows are not rewritten
+    ctx.add_column("user", Column("last_seen_at", Float(), nullable=True))
+    ctx.create_table(login_event)
+    ctx.create_index(
+        login_event,
+        "ix_login_event_user_id_created_at",
+        "user_id",
+        "created_at",
+    )
@@ -0,0 +1,32 @@
+"""Adds the `server_session` table of the server-side sessions."""
+
+# python external imports
+from sqlalchemy import (
+    Column,
+    Float,
+    Index,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    Text,
+)
+
+# app imports
+from codeapp.migrations import MigrationContext
+
+metadata = MetaData()
+
+server_session = Table(
+    "server_session",
+    metadata,
+    Column("id", String(64), primary_key=True),
+    Column("version", Integer(), nullable=False),
+    Column("data", Text(), nullable=False),
+    Column("expires_at", Float(), nullable=False),
+    Index("ix_server_session_expires_at", "expires_at"),
+)
+
+
+def upgrade(ctx: MigrationContext) -> None:
+    ctx.create_table(server_session)
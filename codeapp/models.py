@@ -1,27 +1,117 @@
 # python built-in imports
+import time
 from dataclasses import dataclass, field
+from typing import Optional
 
 # python external modules
 from flask_login import UserMixin
-from sqlalchemy import Column, Integer, String, select
-from sqlalchemy.orm import registry
+from sqlalchemy import Column, Float, Index, Integer, String, Text, select
+from sqlalchemy.orm import deferred, registry
 
 # app imports
 from codeapp import db, login_manager
+from codeapp.sharding import (
+    SHARD_KEY,
+    decode_user_id,
+    encode_user_id,
+    shard_bind_arguments,
+)
 
 mapper_registry = registry(metadata=db.metadata)
 
 
+class SessionUser:
+    """
+    Read-only principal stored in `current_user`.
+    It holds only the columns the templates need and is not tracked
+    by the session, so loading it does not touch the identity map.
+    """
+
+    __slots__ = ("id", "name", "email", "version", "shard")
+
+    is_active = True
+    is_authenticated = True
+    is_anonymous = False
+
+    id: int
+    name: str
+    email: str
+    version: int
+    shard: Optional[int]
+
+    def __init__(
+        self,
+        id: int,
+        name: str,
+        email: str,
+        version: int = 1,
+        shard: Optional[int] = None,
+    ) -> None:
+        # pylint: disable=redefined-builtin
+        object.__setattr__(self, "id", id)
+        object.__setattr__(self, "name", name)
+        object.__setattr__(self, "email", email)
+        object.__setattr__(self, "version", version)
+        object.__setattr__(self, "shard", shard)
+
+    def __setattr__(self, key: str, value: object) -> None:
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __delattr__(self, key: str) -> None:
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, SessionUser):
+            return self.get_id() == other.get_id()
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash(self.get_id())
+
+    def __repr__(self) -> str:
+        return f"SessionUser(id={self.id!r}, email={self.email!r})"
+
+    def get_id(self) -> str:
+        return encode_user_id(self.shard, self.id)
+
+
 @login_manager.user_loader
-def load_user(user_id: int) -> UserMixin:
-    stmt = select(User).where(User.id == user_id).limit(1)
-    return db.session.execute(stmt).scalars().first()
+def load_user(user_id: str) -> Optional[SessionUser]:
+    try:
+        shard, local_id = decode_user_id(user_id)
+    except ValueError:
+        return None
+    stmt = (
+        select(User.id, User.name, User.email, User.version)
+        .where(User.id == local_id)
+        .limit(1)
+    )
+    row = db.session.execute(
+        stmt, bind_arguments=shard_bind_arguments(shard)
+    ).first()
+    if row is None:
+        return None
+    return SessionUser(
+        row.id, row.name, row.email, version=row.version, shard=shard
+    )
+
+
+# incremented by SQLAlchemy on every update of the row,
+# e.g., to tell whether a page showing the user is still valid
+_user_version = Column("version", Integer(), nullable=False, server_default="1")
 
 
 @mapper_registry.mapped
 @dataclass
 class User(UserMixin):
     __tablename__ = "user"
+    # when sharding is enabled, rows are spread by the hash of the email.
+    # ids are never reused, since sessions may still hold the id of a
+    # user moved to another shard by `rebalance_shards()`
+    __table_args__ = {
+        "info": {SHARD_KEY: "email"},
+        "sqlite_autoincrement": True,
+    }
     __sa_dataclass_metadata_key__ = "sa"
     id: int = field(
         init=False,
@@ -35,6 +125,119 @@ class User(UserMixin):
     email: str = field(
         metadata={"sa": Column(String(128), unique=True, nullable=False)}
     )
+    # the hash is only needed when verifying a login,
+    # so it is not loaded together with the rest of the row
     password: str = field(
-        repr=False, metadata={"sa": Column(String(128), nullable=False)}
+        repr=False,
+        metadata={
+            "sa": deferred(Column("password", String(128), nullable=False))
+        },
+    )
+    version: int = field(init=False, repr=False, metadata={"sa": _user_version})
+    # seconds since the epoch, written in batches by `codeapp.activity`
+    last_seen_at: Optional[float] = field(
+        init=False,
+        default=None,
+        repr=False,
+        metadata={"sa": Column(Float(), nullable=True)},
+    )
+    __mapper_args__ = {"version_id_col": _user_version}
+
+
+@mapper_registry.mapped
+@dataclass
+class Job:  # pylint: disable=too-many-instance-attributes
+    """A unit of work queued by a route and run by `manage.py worker`."""
+
+    __tablename__ = "job"
+    # workers look for the next queued job that is due
+    __table_args__ = (Index("ix_job_status_run_at", "status", "run_at"),)
+    __sa_dataclass_metadata_key__ = "sa"
+    id: int = field(
+        init=False,
+        metadata={
+            "sa": Column(Integer(), primary_key=True, autoincrement=True)
+        },
+    )
+    # name under which the function was registered with `@job`
+    name: str = field(metadata={"sa": Column(String(255), nullable=False)})
+    # keyword arguments of the function, encoded as JSON
+    payload: str = field(
+        repr=False, metadata={"sa": Column(Text(), nullable=False)}
+    )
+    # one of `queued`, `running`, `done` or `failed`
+    status: str = field(
+        default="queued", metadata={"sa": Column(String(16), nullable=False)}
+    )
+    attempts: int = field(
+        default=0, metadata={"sa": Column(Integer(), nullable=False)}
+    )
+    max_attempts: int = field(
+        default=5, metadata={"sa": Column(Integer(), nullable=False)}
+    )
+    # timestamps are seconds since the epoch
+    run_at: float = field(
+        default_factory=time.time,
+        metadata={"sa": Column(Float(), nullable=False)},
+    )
+    locked_at: Optional[float] = field(
+        default=None, metadata={"sa": Column(Float(), nullable=True)}
+    )
+    last_error: Optional[str] = field(
+        default=None,
+        repr=False,
+        metadata={"sa": Column(Text(), nullable=True)},
+    )
+
+
+@mapper_registry.mapped
+@dataclass
+class LoginEvent:
+    """A successful login, written in batches by `codeapp.activity`."""
+
+    __tablename__ = "login_event"
+    __table_args__ = (
+        Index("ix_login_event_user_id_created_at", "user_id", "created_at"),
+    )
+    __sa_dataclass_metadata_key__ = "sa"
+    id: int = field(
+        init=False,
+        metadata={
+            "sa": Column(Integer(), primary_key=True, autoincrement=True)
+        },
+    )
+    # the id returned by `SessionUser.get_id()`, which includes the shard
+    user_id: str = field(metadata={"sa": Column(String(32), nullable=False)})
+    # seconds since the epoch
+    created_at: float = field(
+        default_factory=time.time,
+        metadata={"sa": Column(Float(), nullable=False)},
+    )
+    ip: Optional[str] = field(
+        default=None, metadata={"sa": Column(String(45), nullable=True)}
+    )
+    user_agent: Optional[str] = field(
+        default=None,
+        repr=False,
+        metadata={"sa": Column(String(255), nullable=True)},
+    )
+
+
+@mapper_registry.mapped
+@dataclass
+class ServerSession:
+    """Data of a session, whose id is in the cookie. See `codeapp.sessions`."""
+
+    __tablename__ = "server_session"
+    # expired sessions are deleted in bulk
+    __table_args__ = (Index("ix_server_session_expires_at", "expires_at"),)
+    __sa_dataclass_metadata_key__ = "sa"
+    id: str = field(metadata={"sa": Column(String(64), primary_key=True)})
+    # incremented on every write, and sent in the cookie
+    version: int = field(metadata={"sa": Column(Integer(), nullable=False)})
+    # serialized like the cookie of the default Flask sessions
+    data: str = field(
+        repr=False, metadata={"sa": Column(Text(), nullable=False)}
     )
+    # seconds since the epoch
+    expires_at: float = field(metadata={"sa": Column(Float(), nullable=False)})
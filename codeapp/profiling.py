@@ -0,0 +1,224 @@
+"""
+Profiling of routes, without changing their code.
+
+`Profile` runs a block of code under either a stack sampler, which
+writes the collapsed stacks read by flame graph tools (`flamegraph.pl`,
+speedscope), or `cProfile`, which writes a `.prof` file for `pstats` or
+snakeviz. Optionally, `tracemalloc` records where memory was allocated.
+
+It is used by `manage.py profile`, which calls a route many times
+through the test client, and by `ProfilerMiddleware`, which profiles a
+single live request sent with the `X-Profile` header set to
+`PROFILE_REQUEST_TOKEN`.
+"""
+
+# python built-in imports
+import cProfile
+import hmac
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from types import FrameType, TracebackType
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Type
+
+# python external imports
+from flask import Flask, url_for
+from werkzeug.wrappers import Request
+
+MODES = ("sample", "cprofile")
+HEADER = "X-Profile"
+
+WSGIApp = Callable[..., Iterable[bytes]]  # type: ignore[explicit-any]
+
+
+class StackSampler:
+    """Records the stack of one thread every `interval` seconds."""
+
+    def __init__(self, interval: float = 0.001) -> None:
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._target = 0
+
+    def start(self) -> None:
+        self._target = threading.get_ident()
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="stack-sampler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            # pylint: disable=protected-access
+            frame = sys._current_frames().get(self._target)
+            if frame is not None:
+                self.stacks[collapse(frame)] += 1
+
+    def collapsed(self) -> str:
+        """One `frame;frame;frame count` line per stack, most common first."""
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.stacks.most_common()
+        )
+
+
+def collapse(frame: Optional[FrameType]) -> str:
+    names: List[str] = []
+    while frame is not None:
+        code = frame.f_code
+        module = os.path.splitext(os.path.basename(code.co_filename))[0]
+        names.append(f"{module}:{code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class Profile:  # pylint: disable=too-many-instance-attributes
+    """
+    Context manager that profiles its block. `write()` saves the result
+    in `directory` as `<name>.folded` or `<name>.prof`, and the top
+    allocations in `<name>.alloc.txt` when `memory` is set.
+    """
+
+    def __init__(
+        self,
+        mode: str = "sample",
+        memory: bool = False,
+        interval: float = 0.001,
+    ) -> None:
+        if mode not in MODES:
+            raise ValueError(f"Unknown profiling mode: {mode!r}")
+        self.mode = mode
+        self.memory = memory
+        self.sampler = StackSampler(interval)
+        self.profiler = cProfile.Profile()
+        self.snapshot: Optional[tracemalloc.Snapshot] = None
+        self.elapsed = 0.0
+        self._start = 0.0
+        # whether this profile started `tracemalloc`, which is global
+        self._started_tracing = False
+
+    def __enter__(self) -> "Profile":
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start(25)
+            self._started_tracing = True
+        if self.mode == "sample":
+            self.sampler.start()
+        else:
+            self.profiler.enable()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.elapsed = time.perf_counter() - self._start
+        if self.mode == "sample":
+            self.sampler.stop()
+        else:
+            self.profiler.disable()
+        if self.memory and tracemalloc.is_tracing():
+            # leaves out the allocations of the sampler itself
+            self.snapshot = tracemalloc.take_snapshot().filter_traces(
+                [tracemalloc.Filter(False, __file__)]
+            )
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def write(self, directory: str, name: str) -> List[str]:
+        """Returns the paths of the files written."""
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, name)
+        if self.mode == "sample":
+            paths = [f"{base}.folded"]
+            with open(paths[0], "w", encoding="utf-8") as file:
+                file.write(self.sampler.collapsed())
+        else:
+            paths = [f"{base}.prof"]
+            self.profiler.dump_stats(paths[0])
+        if self.snapshot is not None:
+            paths.append(f"{base}.alloc.txt")
+            stats = self.snapshot.statistics("lineno")
+            with open(paths[1], "w", encoding="utf-8") as file:
+                file.writelines(f"{stat}\n" for stat in stats[:50])
+        return paths
+
+
+def profile_route(  # pylint: disable=too-many-arguments
+    app: Flask,
+    target: str,
+    *,
+    number: int = 100,
+    method: str = "GET",
+    data: Optional[Dict[str, str]] = None,
+    login: Optional[Tuple[str, str]] = None,
+    mode: str = "sample",
+    memory: bool = False,
+) -> Profile:
+    """
+    Sends `number` requests to `target`, a path or an endpoint name,
+    through the test client, and profiles them. With `login`, an
+    `(email, password)` pair, the client logs in first.
+    The first request is not profiled, so that lazy setup is left out.
+    """
+    if not target.startswith("/"):
+        with app.test_request_context():
+            target = url_for(target)
+    client = app.test_client()
+    if login is not None:
+        client.post("/login", data={"email": login[0], "password": login[1]})
+    client.open(target, method=method, data=data)
+    with Profile(mode, memory=memory) as profile:
+        for _ in range(number):
+            client.open(target, method=method, data=data)
+    return profile
+
+
+class ProfilerMiddleware:
+    """
+    Profiles the requests sent with the `X-Profile` header set to `token`,
+    and stores the result in `directory`. Other requests are untouched.
+    Profiled requests run one at a time, since `tracemalloc` is global.
+    """
+
+    def __init__(
+        self, app: WSGIApp, token: str, directory: str, mode: str = "sample"
+    ) -> None:
+        self.app = app
+        self.token = token.encode("utf-8")
+        self.directory = directory
+        self.mode = mode
+        self._lock = threading.Lock()
+
+    def __call__(  # type: ignore[explicit-any]
+        self, environ: Dict[str, object], start_response: Callable[..., object]
+    ) -> Iterable[bytes]:
+        request = Request(environ)
+        # WSGI headers are latin-1 strings, which may not be ASCII
+        sent = request.headers.get(HEADER, "").encode("latin-1")
+        if not sent or not hmac.compare_digest(sent, self.token):
+            return self.app(environ, start_response)
+        with self._lock, Profile(self.mode, memory=True) as profile:
+            # consumes the body inside the profiled block
+            response = self.app(environ, start_response)
+            try:
+                body = b"".join(response)
+            finally:
+                if hasattr(response, "close"):
+                    response.close()
+        path = request.path.strip("/").replace("/", ".") or "root"
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{request.method}-{path}"
+        profile.write(self.directory, name)
+        return [body]
@@ -4,12 +4,13 @@ File that contains all the routes of the application.
 This is equivalent to the "controller" part in a model-view-controller architecture.
 """
 
-from typing import Union
+from typing import Dict, Optional, Union
 
 from flask import (
     Blueprint,
     current_app,
     flash,
+    jsonify,
     redirect,
     render_template,
     request,
@@ -22,8 +23,12 @@ from werkzeug.wrappers.response import Response as WerkzeugResponse
 
 # app imports
 from codeapp import bcrypt, db
+from codeapp.caching import conditional_user_page
 from codeapp.forms import LoginForm, RegistrationForm
-from codeapp.models import User
+from codeapp.models import SessionUser, User
+from codeapp.schemas import login_schema, registration_schema
+from codeapp.sharding import shard_bind_arguments, shard_for_email
+from codeapp.tasks import send_welcome_email
 
 Response = Union[str, FlaskResponse, WerkzeugResponse]
 
@@ -61,30 +66,64 @@ The routes below include routes related to the user.
 """
 
 
+def _create_user(name: str, email: str, password: str) -> bool:
+    """Creates the user and returns whether it succeeded."""
+    _password = bcrypt.generate_password_hash(password).decode("utf-8")
+    _user = User(name=name, email=email, password=_password)
+    db.session.add(_user)
+    try:
+        db.session.commit()
+    except Exception as e:
+        current_app.logger.exception(e)
+        db.session.rollback()
+        return False
+    # the e-mail is sent by a worker, after the response.
+    # the user exists at this point, even if the job could not be queued
+    try:
+        send_welcome_email.delay(name=name, email=email)
+    except Exception as e:
+        current_app.logger.exception(e)
+    return True
+
+
+def _authenticate(email: str, password: str) -> Optional[SessionUser]:
+    """Returns the user if the email and password match, else `None`."""
+    # the password hash is deferred on `User`,
+    # so it is selected explicitly only here, where it is verified
+    _stmt = (
+        select(User.id, User.name, User.email, User.version, User.password)
+        .where(User.email == email)
+        .limit(1)
+    )
+    _shard = shard_for_email(email)
+    _row = db.session.execute(
+        _stmt, bind_arguments=shard_bind_arguments(_shard)
+    ).first()
+    current_app.logger.debug(f"User row found: {_row is not None}")
+    if _row and bcrypt.check_password_hash(_row.password, password):
+        return SessionUser(
+            _row.id,
+            _row.name,
+            _row.email,
+            version=_row.version,
+            shard=_shard,
+        )
+    return None
+
+
 @bp.route("/register", methods=["GET", "POST"])
 def register() -> Response:
     if current_user.is_authenticated:
         return redirect(url_for("bp.home"))
     form = RegistrationForm()
     if form.validate_on_submit():
-        _password = bcrypt.generate_password_hash(form.password.data).decode(
-            "utf-8"
-        )
-        _user = User(
-            name=form.name.data, email=form.email.data, password=_password
-        )
-        db.session.add(_user)
-        try:
-            db.session.commit()
+        if _create_user(form.name.data, form.email.data, form.password.data):
             flash("User successfully created. Please log in!", "success")
             return redirect(url_for("bp.login"))
-        except Exception as e:
-            current_app.logger.exception(e)
-            db.session.rollback()
-            flash(
-                "There was an error while creating your user. Please try again later.",
-                "danger",
-            )
+        flash(
+            "There was an error while creating your user. Please try again later.",
+            "danger",
+        )
     return render_template("register.html", form=form)
 
 
@@ -94,12 +133,8 @@ def login() -> Response:
         return redirect(url_for("bp.home"))
     form = LoginForm()
     if form.validate_on_submit():
-        _stmt = select(User).where(User.email == form.email.data).limit(1)
-        _user = db.session.execute(_stmt).scalars().first()
-        current_app.logger.debug(f"User ({type(_user)}): {_user}")
-        if _user and bcrypt.check_password_hash(
-            _user.password, form.password.data
-        ):
+        _user = _authenticate(form.email.data, form.password.data)
+        if _user is not None:
             login_user(_user, remember=form.remember.data)
             next_page = request.args.get("next")
             flash("Welcome!", "success")
@@ -119,5 +154,54 @@ def logout() -> Response:
 
 @bp.get("/profile")
 @login_required
+@conditional_user_page
 def profile() -> Response:
     return render_template("profile.html")
+
+
+"""
+############################### JSON API routes ###############################
+
+The routes below are meant for machine clients.
+They take and return JSON, and validate the payload with the schemas in
+`codeapp.schemas`, which apply the same rules as the forms without
+building them. As browsers cannot send JSON to another site without
+asking first, they do not need a CSRF token.
+"""
+
+
+def _json(payload: Dict[str, object], status: int = 200) -> Response:
+    response = jsonify(payload)
+    response.status_code = status
+    return response
+
+
+@bp.post("/api/register")
+def api_register() -> Response:
+    if not request.is_json:
+        return _json({"error": "Expected a JSON body."}, 415)
+    data, errors = registration_schema.validate(request.get_json(silent=True))
+    if errors:
+        return _json({"errors": errors}, 400)
+    if not _create_user(
+        str(data["name"]), str(data["email"]), str(data["password"])
+    ):
+        return _json({"error": "The user could not be created."}, 500)
+    return _json({"name": data["name"], "email": data["email"]}, 201)
+
+
+@bp.post("/api/login")
+def api_login() -> Response:
+    if not request.is_json:
+        return _json({"error": "Expected a JSON body."}, 415)
+    payload = request.get_json(silent=True)
+    data, errors = login_schema.validate(payload)
+    if errors:
+        return _json({"errors": errors}, 400)
+    _user = _authenticate(str(data["email"]), str(data["password"]))
+    if _user is None:
+        return _json({"error": "Please check email and password."}, 401)
+    login_user(_user, remember=bool(payload and payload.get("remember")))
+    return _json(
+        {"id": _user.get_id(), "name": _user.name, "email": _user.email}
+    )
@@ -0,0 +1,303 @@
+# pylint: disable=cyclic-import
+"""
+Server-side sessions, so that the cookie only carries an opaque id.
+
+With the default sessions of Flask, the flashed messages, the state of
+Flask-Login and the CSRF token are serialized, signed and sent back and
+forth in the cookie on every request. Here, the cookie holds a random
+session id and a version number, signed when `SESSION_USE_SIGNER` is
+set, and the data is stored in the `server_session` table, either in
+the app database or in `SESSION_DATABASE_URI` (e.g., a local SQLite
+file).
+
+Each process keeps the most recently used sessions in memory. A cached
+session is only used when its version matches the one in the cookie, so
+a session written by another process is never read stale. A session is
+only written over the version it was read at, so that when two requests
+of the same client save it at the same time, the first one wins instead
+of both storing the same version with different data.
+Sessions are written only when they change, and their expiry is only
+pushed back once half of `PERMANENT_SESSION_LIFETIME` has passed.
+Expired rows are ignored when read and deleted in bulk from time to time.
+
+The session gets a new id on login and logout, so that an id planted in
+the browser before the login (session fixation) is worth nothing after it.
+"""
+
+# python built-in imports
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional, Tuple
+
+# python external imports
+from flask import Flask, Request, Response
+from flask import session as current_session
+from flask.sessions import (
+    SecureCookieSession,
+    SessionInterface,
+    session_json_serializer,
+)
+from itsdangerous import BadSignature, Signer
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.engine import Engine
+
+# app imports
+from codeapp.models import ServerSession
+
+# key under which the `SessionStore` is stored in `app.extensions`
+EXTENSION_KEY = "sessions"
+SALT = "server-side-session"
+
+
+class StoredSession(NamedTuple):
+    version: int
+    data: str
+    expires_at: float
+
+
+class ServerSideSession(SecureCookieSession):
+    def __init__(
+        self,
+        initial: Optional[dict] = None,  # type: ignore[type-arg]
+        sid: Optional[str] = None,
+        version: int = 0,
+        expires_at: float = 0.0,
+    ) -> None:
+        super().__init__(initial)
+        # a new session gets a new id, never one sent by the client
+        self.new = sid is None
+        self.sid = sid or secrets.token_urlsafe(32)
+        self.version = version
+        self.expires_at = expires_at
+        # when set, the session is saved under a new id
+        self.regenerate = False
+        # set when the cookie has an older version than the stored session,
+        # e.g., after the browser missed a `Set-Cookie`
+        self.stale_cookie = False
+
+
+def regenerate_session(*_: object, **__: object) -> None:
+    """Receiver of `user_logged_in` and `user_logged_out`."""
+    if isinstance(current_session, ServerSideSession):
+        current_session.regenerate = True
+
+
+class SessionStore:
+    """Rows of `server_session`, with the hot sessions cached in front."""
+
+    def __init__(
+        self,
+        engine: Engine,
+        cache_size: int = 1024,
+        cleanup_interval: float = 300.0,
+    ) -> None:
+        self.engine = engine
+        self.cache_size = cache_size
+        self.cleanup_interval = cleanup_interval
+        self.table = ServerSession.__table__  # type: ignore[attr-defined]
+        self._cache: "OrderedDict[str, StoredSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_cleanup = time.time()
+
+    def get(self, sid: str, version: int) -> Optional[StoredSession]:
+        """Returns the session, unless it is missing or expired."""
+        with self._lock:
+            stored = self._cache.get(sid)
+            if stored is not None and stored.version == version:
+                self._cache.move_to_end(sid)
+        if stored is None or stored.version != version:
+            with self.engine.connect() as conn:
+                row = conn.execute(
+                    select(
+                        self.table.c.version,
+                        self.table.c.data,
+                        self.table.c.expires_at,
+                    ).where(self.table.c.id == sid)
+                ).first()
+            if row is None:
+                return None
+            stored = StoredSession(row.version, row.data, row.expires_at)
+            self._remember(sid, stored)
+        if stored.expires_at < time.time():
+            return None
+        return stored
+
+    def put(self, sid: str, stored: StoredSession, previous: int = 0) -> bool:
+        """
+        Writes the session only if its stored version is still `previous`,
+        or inserts it when `previous` is 0. Returns whether it was written,
+        which is not the case when another request wrote it first.
+        """
+        values = stored._asdict()
+        with self.engine.begin() as conn:
+            if previous:
+                written = conn.execute(
+                    update(self.table)
+                    .where(self.table.c.id == sid)
+                    .where(self.table.c.version == previous)
+                    .values(**values)
+                ).rowcount
+            else:
+                written = conn.execute(
+                    insert(self.table).values(id=sid, **values)
+                ).rowcount
+        if written:
+            self._remember(sid, stored)
+        else:
+            # the cached copy, if any, is older than the stored one
+            with self._lock:
+                self._cache.pop(sid, None)
+        if time.time() - self._last_cleanup > self.cleanup_interval:
+            self.delete_expired()
+        return bool(written)
+
+    def delete(self, sid: str) -> None:
+        with self._lock:
+            self._cache.pop(sid, None)
+        with self.engine.begin() as conn:
+            conn.execute(delete(self.table).where(self.table.c.id == sid))
+
+    def delete_expired(self) -> int:
+        """Returns the number of sessions deleted."""
+        self._last_cleanup = time.time()
+        with self.engine.begin() as conn:
+            result = conn.execute(
+                delete(self.table).where(
+                    self.table.c.expires_at < self._last_cleanup
+                )
+            )
+        return int(result.rowcount)
+
+    def _remember(self, sid: str, stored: StoredSession) -> None:
+        with self._lock:
+            self._cache[sid] = stored
+            self._cache.move_to_end(sid)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+
+def get_session_store(app: Flask) -> SessionStore:
+    store: SessionStore = app.extensions[EXTENSION_KEY]
+    return store
+
+
+class ServerSideSessionInterface(SessionInterface):
+    serializer = session_json_serializer
+
+    @staticmethod
+    def _signer(app: Flask) -> Optional[Signer]:
+        if not app.config["SESSION_USE_SIGNER"]:
+            return None
+        return Signer(app.secret_key or "", salt=SALT)
+
+    def _parse_cookie(
+        self, app: Flask, value: str
+    ) -> Optional[Tuple[str, int]]:
+        signer = self._signer(app)
+        try:
+            if signer is not None:
+                value = signer.unsign(value).decode("utf-8")
+        except BadSignature:
+            return None
+        sid, _, version = value.rpartition(".")
+        if not sid or not version.isdigit():
+            return None
+        return sid, int(version)
+
+    def open_session(
+        self, app: Flask, request: Request
+    ) -> Optional[ServerSideSession]:
+        if app.config["SESSION_USE_SIGNER"] and not app.secret_key:
+            # the same as Flask does, to show the error for a missing key
+            return None
+        value = request.cookies.get(self.get_cookie_name(app))
+        parsed = self._parse_cookie(app, value) if value else None
+        if parsed is None:
+            return ServerSideSession()
+        sid, version = parsed
+        stored = get_session_store(app).get(sid, version)
+        if stored is None:
+            return ServerSideSession()
+        # the version actually read is the one the next write replaces
+        session = ServerSideSession(
+            self.serializer.loads(stored.data),
+            sid=sid,
+            version=stored.version,
+            expires_at=stored.expires_at,
+        )
+        session.stale_cookie = stored.version != version
+        return session
+
+    def save_session(  # type: ignore[override]
+        self, app: Flask, session: ServerSideSession, response: Response
+    ) -> None:
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        store = get_session_store(app)
+
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        if not session:
+            if session.modified and not session.new:
+                store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+                response.vary.add("Cookie")
+            return
+
+        if session.regenerate and not session.new:
+            # the row of the old id is dropped
+            store.delete(session.sid)
+            session.sid = secrets.token_urlsafe(32)
+            session.version = 0
+            session.new = session.modified = True
+
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        now = time.time()
+        if not session.modified and session.expires_at - now > lifetime / 2:
+            if session.stale_cookie:
+                self._set_cookie(app, session, response)
+            return
+
+        if session.new and app.config["SESSION_PERMANENT"]:
+            session.permanent = True
+        previous = session.version
+        session.version += 1
+        session.expires_at = now + lifetime
+        written = store.put(
+            session.sid,
+            StoredSession(
+                session.version,
+                self.serializer.dumps(dict(session)),
+                session.expires_at,
+            ),
+            previous,
+        )
+        if not written:
+            # a concurrent request of the same client saved the session
+            # first, and its changes are kept instead of these ones
+            app.logger.info("Session written by a concurrent request.")
+            return
+        self._set_cookie(app, session, response)
+
+    def _set_cookie(
+        self, app: Flask, session: ServerSideSession, response: Response
+    ) -> None:
+        value = f"{session.sid}.{session.version}"
+        signer = self._signer(app)
+        if signer is not None:
+            value = signer.sign(value).decode("utf-8")
+        response.set_cookie(
+            self.get_cookie_name(app),
+            value,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=self.get_cookie_domain(app),
+            path=self.get_cookie_path(app),
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+        response.vary.add("Cookie")
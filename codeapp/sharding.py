@@ -0,0 +1,207 @@
+"""
+Optional horizontal sharding of the tables marked with a shard key.
+
+When `SQLALCHEMY_SHARD_URIS` lists N databases, the rows of every table
+whose `info` has a `shard_key` (e.g., the `user` table, keyed by email)
+are spread across these N databases by a stable hash of the normalised
+key. Every other table stays in `SQLALCHEMY_DATABASE_URI`.
+Since ids are only unique inside a shard, the id exposed to Flask-Login
+encodes the shard, e.g., `"3-42"` is the user with id 42 in shard 3.
+"""
+
+# python built-in imports
+import hashlib
+from typing import Callable, Dict, List, Optional, Tuple
+
+# python external imports
+from flask import current_app, has_app_context
+from sqlalchemy import MetaData, Table, delete, insert, inspect, select
+from sqlalchemy.engine import Engine
+
+# key under which the `ShardSet` is stored in `app.extensions`
+EXTENSION_KEY = "shards"
+# prefix of the keys added to `SQLALCHEMY_BINDS` for each shard
+BIND_PREFIX = "shard_"
+# key of `Table.info` naming the column used to choose the shard
+SHARD_KEY = "shard_key"
+# separates the shard from the local id in the encoded user id
+ID_SEPARATOR = "-"
+
+
+def normalize_email(email: str) -> str:
+    return email.strip().lower()
+
+
+def shard_index(key: str, shard_count: int) -> int:
+    """
+    Stable across processes and releases, unlike the built-in `hash()`,
+    which is randomized for strings.
+    """
+    digest = hashlib.blake2b(
+        normalize_email(key).encode("utf-8"), digest_size=8
+    ).digest()
+    return int.from_bytes(digest, "big") % shard_count
+
+
+class ShardSet:
+    def __init__(self, engines: List[Engine]) -> None:
+        self.engines = engines
+
+    def index_for(self, key: str) -> int:
+        return shard_index(key, len(self.engines))
+
+    def engine_for(self, key: str) -> Engine:
+        return self.engines[self.index_for(key)]
+
+
+def get_shard_set() -> Optional[ShardSet]:
+    if not has_app_context():
+        return None
+    shards: Optional[ShardSet] = current_app.extensions.get(EXTENSION_KEY)
+    return shards
+
+
+def shard_bind_keys(uris: List[str]) -> Dict[str, str]:
+    """Returns the entries to add to `SQLALCHEMY_BINDS` for the shards."""
+    return {f"{BIND_PREFIX}{idx}": uri for idx, uri in enumerate(uris)}
+
+
+def shard_for_email(email: str) -> Optional[int]:
+    """Returns the shard holding `email`, or `None` when not sharded."""
+    shards = get_shard_set()
+    if shards is None:
+        return None
+    return shards.index_for(email)
+
+
+def shard_bind_arguments(shard: Optional[int]) -> Dict[str, Engine]:
+    """
+    Returns the `bind_arguments` for `db.session.execute()` that send
+    the statement to `shard`, or no arguments when not sharded.
+    """
+    shards = get_shard_set()
+    if shards is None or shard is None:
+        return {}
+    return {"bind": shards.engines[shard]}
+
+
+def encode_user_id(shard: Optional[int], local_id: int) -> str:
+    if shard is None:
+        return str(local_id)
+    return f"{shard}{ID_SEPARATOR}{local_id}"
+
+
+def decode_user_id(user_id: str) -> Tuple[Optional[int], int]:
+    """
+    Splits an id built by `encode_user_id()` into shard and local id.
+    Raises `ValueError` if the id is malformed, or if it does not point
+    to an existing shard.
+    """
+    shards = get_shard_set()
+    if shards is None:
+        if not user_id.isdigit():
+            raise ValueError(f"Invalid user id: {user_id!r}")
+        return None, int(user_id)
+    shard, _, local_id = user_id.partition(ID_SEPARATOR)
+    if not shard.isdigit() or not local_id.isdigit():
+        raise ValueError(f"Invalid sharded user id: {user_id!r}")
+    if int(shard) >= len(shards.engines):
+        raise ValueError(f"Unknown shard in user id: {user_id!r}")
+    return int(shard), int(local_id)
+
+
+def sharded_tables(metadata: MetaData) -> List[Table]:
+    return [
+        table for table in metadata.sorted_tables if SHARD_KEY in table.info
+    ]
+
+
+def create_shard_schemas(metadata: MetaData, drop: bool = False) -> int:
+    """
+    Creates the sharded tables in every shard.
+    Returns the number of shards, which is 0 when not sharded.
+    """
+    shards = get_shard_set()
+    if shards is None:
+        return 0
+    tables = sharded_tables(metadata)
+    for engine in shards.engines:
+        if drop:
+            metadata.drop_all(bind=engine, tables=tables)
+        metadata.create_all(bind=engine, tables=tables)
+    return len(shards.engines)
+
+
+def rebalance_shards(
+    metadata: MetaData,
+    batch_size: int = 500,
+    primary: Optional[Engine] = None,
+    on_move: Optional[Callable[[str, str], None]] = None,
+) -> int:
+    """
+    Moves the rows that are not in the shard their key hashes to,
+    e.g., after a shard was added to `SQLALCHEMY_SHARD_URIS`.
+    With `primary`, the rows still in the sharded tables of that database,
+    written before sharding was enabled, are moved to their shards too.
+    Each row is copied before it is deleted, so the command can be
+    interrupted and run again.
+    Moved rows get a new local id, so `on_move` is called with the old
+    and the new encoded ids, before the old row is deleted, to update
+    what refers to them. Ids are never reused (`sqlite_autoincrement`,
+    sequences on PostgreSQL), so sessions and remember cookies holding
+    an old id no longer load a user: moved users are logged out.
+    Returns the number of rows moved.
+    """
+    shards = get_shard_set()
+    if shards is None:
+        return 0
+    moved = 0
+    for table in sharded_tables(metadata):
+        key = table.c[table.info[SHARD_KEY]]
+        (pk,) = table.primary_key.columns
+        columns = [column for column in table.c if column is not pk]
+        sources: List[Tuple[Optional[int], Engine]] = list(
+            enumerate(shards.engines)
+        )
+        if primary is not None and inspect(primary).has_table(table.name):
+            sources.insert(0, (None, primary))
+        for source_idx, source in sources:
+            last_id = 0
+            while True:
+                with source.connect() as conn:
+                    rows = (
+                        conn.execute(
+                            select(pk, *columns)
+                            .where(pk > last_id)
+                            .order_by(pk)
+                            .limit(batch_size)
+                        )
+                        .mappings()
+                        .all()
+                    )
+                if not rows:
+                    break
+                last_id = rows[-1][pk]
+                for row in rows:
+                    target_idx = shards.index_for(row[key])
+                    if target_idx == source_idx:
+                        continue
+                    values = {column.name: row[column] for column in columns}
+                    with shards.engines[target_idx].begin() as conn:
+                        # copied already by a run that was interrupted
+                        new_id = conn.execute(
+                            select(pk).where(key == row[key])
+                        ).scalar()
+                        if new_id is None:
+                            (new_id,) = conn.execute(
+                                insert(table).values(**values)
+                            ).inserted_primary_key or (0,)
+                    if on_move is not None:
+                        on_move(
+                            encode_user_id(source_idx, row[pk]),
+                            encode_user_id(target_idx, new_id),
+                        )
+                    with source.begin() as conn:
+                        conn.execute(delete(table).where(pk == row[pk]))
+                    moved += 1
+    return moved
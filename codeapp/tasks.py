@@ -0,0 +1,16 @@
+"""
+Background jobs of the application.
+Routes queue them with `.delay(...)` and `manage.py worker` runs them.
+"""
+
+# python external imports
+from flask import current_app
+
+# app imports
+from codeapp.jobs import job
+
+
+@job(max_attempts=5)
+def send_welcome_email(name: str, email: str) -> None:
+    # there is no mail server configured yet, so the e-mail is only logged
+    current_app.logger.info(f"Welcome e-mail sent to {name} <{email}>.")
@@ -0,0 +1,93 @@
+import logging
+import time
+from unittest.mock import patch
+
+from sqlalchemy import delete, select, update
+
+from codeapp import db
+from codeapp.activity import ActivityBuffer, get_activity_buffer
+from codeapp.models import LoginEvent, SessionUser, User
+
+from .utils import TestCase
+
+
+class TestActivity(TestCase):
+    def setUp(self) -> None:
+        buffer = get_activity_buffer()
+        assert buffer is not None
+        self.buffer = buffer
+        self.user = SessionUser(1, "Default User", "default@chalmers.se")
+
+    def tearDown(self) -> None:
+        db.session.execute(delete(LoginEvent))
+        db.session.execute(update(User).values(last_seen_at=None))
+        db.session.commit()
+
+    def last_seen(self) -> float:
+        value: float = db.session.execute(
+            select(User.last_seen_at).where(User.id == 1)
+        ).scalar_one()
+        return value
+
+    def test_login_is_buffered(self) -> None:
+        self.client.post(
+            "/login",
+            data={"email": "default@chalmers.se", "password": "testing"},
+            headers={"User-Agent": "tests"},
+        )
+        self.assertIsNone(db.session.execute(select(LoginEvent)).first())
+        # the login and the page after it are a single item
+        self.client.get("/")
+        self.assertEqual(self.buffer.flush(), 2)
+        event = db.session.execute(select(LoginEvent)).scalar_one()
+        self.assertEqual(event.user_id, "1")
+        self.assertEqual(event.user_agent, "tests")
+        self.assertIsNotNone(self.last_seen())
+
+    def test_touches_are_coalesced(self) -> None:
+        self.buffer.touch(self.user, 1000.0)
+        self.buffer.touch(self.user, 1030.0)
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(self.last_seen(), 1000.0)
+        self.buffer.touch(self.user, 1090.0)
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(self.last_seen(), 1090.0)
+        self.assertEqual(self.buffer.flush(), 0)
+
+    def test_older_touch_does_not_win(self) -> None:
+        self.buffer.touch(self.user, 2000.0)
+        self.buffer.flush()
+        other = ActivityBuffer(db.engine, flush_interval=0)
+        other.touch(self.user, 1000.0)
+        other.flush()
+        self.assertEqual(self.last_seen(), 2000.0)
+
+    def test_flush_when_full(self) -> None:
+        buffer = ActivityBuffer(db.engine, flush_interval=0, max_pending=1)
+        buffer.touch(self.user)
+        self.assertIsNotNone(self.last_seen())
+
+    def test_timer(self) -> None:
+        buffer = ActivityBuffer(db.engine, flush_interval=0.01)
+        calls = []
+
+        def flush() -> int:
+            calls.append(time.time())
+            if len(calls) == 1:
+                raise RuntimeError("Database down")
+            return 0
+
+        with patch.object(buffer, "flush", side_effect=flush):
+            buffer.touch(self.user)
+            time.sleep(0.1)
+            buffer.stop()
+        # the timer survived the error
+        self.assertGreaterEqual(len(calls), 3)
+
+    def test_without_app_context(self) -> None:
+        with patch("codeapp.activity.has_app_context", return_value=False):
+            self.assertIsNone(get_activity_buffer())
+
+
+if __name__ == "__main__":
+    logging.fatal("This file cannot be run directly. Run `pytest` instead.")
@@ -0,0 +1,116 @@
+import logging
+import os
+import time
+from unittest.mock import patch
+
+from codeapp import create_app as ca
+from codeapp.admission import (
+    EXTENSION_KEY,
+    AdmissionController,
+    get_admission_controller,
+)
+
+from .utils import TestCase
+
+
+class TestAdmission(TestCase):
+    def controller(self) -> AdmissionController:
+        controller = get_admission_controller()
+        assert controller is not None
+        return controller
+
+    def test_requests_are_counted_out(self) -> None:
+        self.assert200(self.client.get("/about"))
+        self.client.get("/static/style.css")
+        self.client.post("/login", data={})
+        self.client.post("/api/missing", json={})
+        controller = self.controller()
+        self.assertEqual(controller.in_flight, 0)
+        self.assertEqual(
+            {
+                name: state.in_flight
+                for name, state in controller.classes.items()
+            },
+            {"auth": 0, "write": 0, "user": 0, "page": 0, "static": 0},
+        )
+
+    def test_class_over_its_limit_is_shed(self) -> None:
+        controller = self.controller()
+        state = controller.classes["auth"]
+        state.limit = 1
+        state.in_flight = 1
+        response = self.client.get("/login")
+        self.assertStatus(response, 503)
+        self.assertEqual(
+            response.headers["Retry-After"],
+            str(self.app.config["ADMISSION_RETRY_AFTER"]),
+        )
+        # other classes are still served
+        self.assert200(self.client.get("/about"))
+
+    def test_logged_users_have_their_own_class(self) -> None:
+        self.client.post(
+            "/login",
+            data={"email": "default@chalmers.se", "password": "testing"},
+        )
+        state = self.controller().classes["user"]
+        state.limit = 1
+        state.in_flight = 1
+        self.assertStatus(self.client.get("/profile"), 503)
+        # anonymous pages keep their own budget
+        self.client.delete_cookie("session")
+        self.assert200(self.client.get("/about"))
+        # a remember cookie is enough to tell a logged user
+        self.client.set_cookie("remember_token", "x")
+        self.assertStatus(self.client.get("/about"), 503)
+
+    def test_expensive_classes_are_shed_first(self) -> None:
+        controller = self.controller()
+        controller.in_flight = int(0.8 * controller.max_in_flight)
+        self.assertStatus(self.client.get("/login"), 503)
+        self.assertStatus(self.client.post("/api/missing", json={}), 503)
+        self.assert200(self.client.get("/about"))
+
+    def test_long_queued_requests_are_shed(self) -> None:
+        queued = str(int((time.time() - 60) * 1000))
+        response = self.client.get(
+            "/about", headers={"X-Request-Start": queued}
+        )
+        self.assertStatus(response, 503)
+        recent = str(int(time.time() * 1000))
+        response = self.client.get(
+            "/about", headers={"X-Request-Start": recent}
+        )
+        self.assert200(response)
+
+    def test_limit_adapts_to_latency(self) -> None:
+        controller = AdmissionController(
+            10, {"page": 1.0}, {"page": 0.1}, min_limit=2
+        )
+        for _ in range(50):
+            self.assertTrue(controller.acquire("page"))
+            controller.release("page", 1.0)
+        self.assertEqual(controller.classes["page"].limit, 2)
+        for _ in range(50):
+            self.assertTrue(controller.acquire("page"))
+            controller.release("page", 0.001)
+        self.assertEqual(controller.classes["page"].limit, 10)
+
+    def test_capped_at_web_threads(self) -> None:
+        self.assertEqual(
+            self.controller().max_in_flight, self.app.config["WEB_THREADS"]
+        )
+        os.environ["FLASK_ENV"] = "testing"
+        with patch(
+            "codeapp.config.TestingConfig.ADMISSION_MAX_IN_FLIGHT", 32
+        ), patch("codeapp.config.TestingConfig.WEB_THREADS", 4):
+            app = ca("codeapp.config.TestingConfig")
+        self.assertEqual(app.extensions[EXTENSION_KEY].max_in_flight, 4)
+
+    def test_disabled(self) -> None:
+        del self.app.extensions[EXTENSION_KEY]
+        self.assert200(self.client.get("/about"))
+
+
+if __name__ == "__main__":
+    logging.fatal("This file cannot be run directly. Run `pytest` instead.")
@@ -0,0 +1,113 @@
+import logging
+from unittest.mock import DEFAULT, Mock, patch
+
+from codeapp.forms import RegistrationForm
+from codeapp.schemas import login_schema, registration_schema
+
+from .utils import TestCase
+
+
+class TestApi(TestCase):
+    def test_login(self) -> None:
+        response = self.client.post(
+            "/api/login",
+            json={"email": "default@chalmers.se", "password": "testing"},
+        )
+        self.assert200(response)
+        self.assertEqual(response.json["email"], "default@chalmers.se")
+        self.assert200(self.client.get("/profile"))
+
+    def test_login_wrong_password(self) -> None:
+        response = self.client.post(
+            "/api/login",
+            json={"email": "default@chalmers.se", "password": "123456"},
+        )
+        self.assert401(response)
+
+    def test_login_invalid_payload(self) -> None:
+        response = self.client.post(
+            "/api/login", json={"email": "abc", "password": 12345}
+        )
+        self.assert400(response)
+        self.assertEqual(
+            response.json["errors"],
+            {
+                "email": ["Field must be at least 5 characters long."],
+                "password": ["Field must be a string."],
+            },
+        )
+        response = self.client.post("/api/login", json=["not", "a", "dict"])
+        self.assert400(response)
+        self.assertIn("_schema", response.json["errors"])
+
+    def test_not_json(self) -> None:
+        for url in ("/api/login", "/api/register"):
+            response = self.client.post(url, data={"email": "x"})
+            self.assertStatus(response, 415)
+
+    def test_register_errors_match_form(self) -> None:
+        payload = {
+            "name": "T",
+            "email": "default@chalmers.se",
+            "password": "testing",
+            "confirm_password": "justtest",
+        }
+        response = self.client.post("/api/register", json=payload)
+        self.assert400(response)
+        with self.app.test_request_context(
+            "/register", method="POST", data=payload
+        ):
+            form = RegistrationForm()
+            form.validate()
+            self.assertEqual(response.json["errors"], form.errors)
+
+    def test_register_missing_and_invalid_email(self) -> None:
+        _, errors = registration_schema.validate(
+            {"name": "   ", "email": "not-an-email"}
+        )
+        self.assertEqual(errors["name"], ["This field is required."])
+        self.assertEqual(errors["email"][0], "Invalid email address.")
+        self.assertEqual(errors["password"], ["This field is required."])
+        data, errors = login_schema.validate(
+            {"email": "default@chalmers.se", "password": "testing"}
+        )
+        self.assertEqual(errors, {})
+        self.assertEqual(data["email"], "default@chalmers.se")
+
+    def test_register_success(self) -> None:
+        with patch.multiple(
+            "codeapp.routes.db.session", add=DEFAULT, commit=DEFAULT
+        ) as mocks:
+            response = self.client.post(
+                "/api/register",
+                json={
+                    "name": "Testing User",
+                    "email": "newapi@chalmers.se",
+                    "password": "testing",
+                    "confirm_password": "testing",
+                },
+            )
+            mocks["add"].assert_called_once()
+            mocks["commit"].assert_called_once()
+        self.assertStatus(response, 201)
+
+    def test_register_exception(self) -> None:
+        with patch.multiple(
+            "codeapp.routes.db.session",
+            add=DEFAULT,
+            commit=Mock(side_effect=ValueError("Mock error")),
+        ):
+            response = self.client.post(
+                "/api/register",
+                json={
+                    "name": "Testing User",
+                    "email": "api_exception@chalmers.se",
+                    "password": "testing",
+                    "confirm_password": "testing",
+                },
+            )
+        self.assert500(response)
+
+
+if __name__ == "__main__":
+    logging.fatal("This file cannot be run directly. Run `pytest` instead.")
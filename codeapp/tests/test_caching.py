@@ -0,0 +1,99 @@
+import logging
+
+from flask import g, request
+from flask_login import login_required
+
+from codeapp import db
+from codeapp.caching import conditional_user_page
+from codeapp.models import User
+
+from .utils import TestCase
+
+
+class TestCaching(TestCase):
+    def login(self) -> None:
+        self.client.post(
+            "/login",
+            data={"email": "default@chalmers.se", "password": "testing"},
+        )
+        # consumes the `Welcome!` message
+        self.client.get("/")
+
+    def test_profile_etag(self) -> None:
+        self.login()
+        response = self.client.get("/profile")
+        self.assert200(response)
+        etag = response.headers["ETag"]
+        self.assertIn("private", response.headers["Cache-Control"])
+
+        response = self.client.get("/profile", headers={"If-None-Match": etag})
+        self.assertStatus(response, 304)
+        self.assertEqual(response.data, b"")
+        self.assertEqual(response.headers["ETag"], etag)
+
+    def test_profile_changes_with_version(self) -> None:
+        self.login()
+        etag = self.client.get("/profile").headers["ETag"]
+
+        _user = db.session.get(User, 1)
+        assert _user is not None
+        version = _user.version
+        _user.name = "Renamed User"
+        db.session.commit()
+        self.assertEqual(_user.version, version + 1)
+        # the test client shares `g` between requests,
+        # so the user cached by Flask-Login is dropped by hand
+        g.pop("_login_user", None)
+        try:
+            response = self.client.get(
+                "/profile", headers={"If-None-Match": etag}
+            )
+            self.assert200(response)
+            self.assertIn("Renamed User", response.data.decode())
+            self.assertNotEqual(response.headers["ETag"], etag)
+        finally:
+            _user.name = "Default User"
+            db.session.commit()
+
+    def test_view_arguments_and_query_string(self) -> None:
+        @self.app.get("/pages/<int:number>")
+        @login_required
+        @conditional_user_page
+        def page(number: int) -> str:
+            return f"{number} {request.args.get('sort')}"
+
+        self.login()
+        response = self.client.get("/pages/1?sort=name")
+        self.assertEqual(response.data, b"1 name")
+        etag = response.headers["ETag"]
+        # another page, or the same one sorted differently, is not a match
+        for url in ("/pages/2?sort=name", "/pages/1?sort=date"):
+            response = self.client.get(url, headers={"If-None-Match": etag})
+            self.assert200(response)
+            self.assertNotEqual(response.headers["ETag"], etag)
+        response = self.client.get(
+            "/pages/1?sort=name", headers={"If-None-Match": etag}
+        )
+        self.assertStatus(response, 304)
+
+    def test_profile_with_flashed_messages(self) -> None:
+        response = self.client.post(
+            "/login?next=/profile",
+            data={"email": "default@chalmers.se", "password": "testing"},
+            follow_redirects=True,
+        )
+        self.assertIn("Welcome!", response.data.decode())
+        self.assertNotIn("ETag", response.headers)
+
+    def test_templates_hash_in_debug(self) -> None:
+        self.login()
+        self.app.debug = True
+        try:
+            etag = self.client.get("/profile").headers["ETag"]
+            self.assertEqual(self.client.get("/profile").headers["ETag"], etag)
+        finally:
+            self.app.debug = False
+
+
+if __name__ == "__main__":
+    logging.fatal("This file cannot be run directly. Run `pytest` instead.")
@@ -0,0 +1,156 @@
+import logging
+import os
+import time
+from unittest.mock import patch
+
+from flask import Flask, session
+from sqlalchemy import select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import OperationalError
+
+from codeapp import create_app as ca
+from codeapp import db
+from codeapp.database import (
+    PIN_SESSION_KEY,
+    get_replica_set,
+    sync_sqlite_replicas,
+)
+from codeapp.models import User, load_user
+
+from .utils import TestCase
+
+
+class TestReplicaRouting(TestCase):
+    def create_app(self) -> Flask:
+        os.environ["FLASK_ENV"] = "testing"
+        app = ca("codeapp.config.TestingReplicaConfig")
+        return app
+
+    def setUp(self) -> None:
+        self.assertEqual(sync_sqlite_replicas(), 1)
+        replicas = get_replica_set()
+        assert replicas is not None
+        self.replicas = replicas
+        self.primary = db.engines[None]
+        self.replica = replicas.engines[0]
+
+    def test_reads_go_to_replica(self) -> None:
+        stmt = select(User.id)
+        self.assertIs(db.session.get_bind(clause=stmt), self.replica)
+        self.assertIs(
+            db.session.get_bind(clause=stmt.with_for_update()), self.primary
+        )
+
+    def test_writes_pin_to_primary(self) -> None:
+        self.assertIs(
+            db.session.get_bind(clause=text("DELETE FROM user WHERE 0")),
+            self.primary,
+        )
+        # once the session wrote, reads stay on the primary
+        self.assertIs(db.session.get_bind(clause=select(User.id)), self.primary)
+
+    def test_pin_across_requests(self) -> None:
+        with self.app.test_request_context("/"):
+            session[PIN_SESSION_KEY] = time.time() + 60
+            self.assertIs(
+                db.session.get_bind(clause=select(User.id)), self.primary
+            )
+
+    def test_login_reads_from_replica(self) -> None:
+        with patch.object(
+            self.replicas, "choose", wraps=self.replicas.choose
+        ) as mock_choose:
+            response = self.client.post(
+                "/login",
+                data={"email": "default@chalmers.se", "password": "testing"},
+                follow_redirects=True,
+            )
+            mock_choose.assert_called()
+        self.assertTemplateUsed("home.html")
+        self.assertMessageFlashed("Welcome!", "success")
+        self.assert_html(response)
+
+    def test_unhealthy_replica_falls_back(self) -> None:
+        self.replicas.mark_down(self.replica)
+        self.assertIs(db.session.get_bind(clause=select(User.id)), self.primary)
+        # after the cool-down, the replica is pinged and used again
+        self.replicas.health_interval = 0.0
+        self.assertIs(db.session.get_bind(clause=select(User.id)), self.replica)
+
+    def test_failed_ping_keeps_replica_down(self) -> None:
+        self.replicas.mark_down(self.replica)
+        self.replicas.health_interval = 0.0
+        with patch.object(
+            self.replica,
+            "connect",
+            side_effect=OperationalError("SELECT 1", {}, Exception("down")),
+        ):
+            self.assertIsNone(self.replicas.choose())
+
+    def test_recovered_by_two_threads(self) -> None:
+        # pylint: disable=protected-access
+        self.replicas.mark_down(self.replica)
+        self.replicas.health_interval = 0.0
+        connect = self.replica.connect
+
+        def connect_after_other_thread() -> Connection:
+            # another thread pinged the replica and brought it back first
+            self.replicas._down_since.clear()
+            return connect()
+
+        with patch.object(
+            self.replica, "connect", side_effect=connect_after_other_thread
+        ):
+            self.assertTrue(self.replicas.is_healthy(0))
+
+    def test_failing_replica_retries_on_primary(self) -> None:
+        with self.replica.connect() as conn:
+            conn.execute(text("DROP TABLE user"))
+            conn.commit()
+        stmt = select(User.email).where(User.id == 1)
+        self.assertEqual(
+            db.session.execute(stmt).scalar(), "default@chalmers.se"
+        )
+        self.assertIsNone(self.replicas.choose())
+
+    def test_failing_primary_is_raised(self) -> None:
+        db.session.get_bind(clause=text("DELETE FROM user WHERE 0"))
+        with self.assertRaises(OperationalError):
+            db.session.execute(text("SELECT * FROM missing_table"))
+
+    def test_outside_request(self) -> None:
+        with patch("codeapp.database.has_request_context", return_value=False):
+            self.assertIs(
+                db.session.get_bind(clause=select(User.id)), self.replica
+            )
+        with patch("codeapp.database.has_app_context", return_value=False):
+            self.assertIsNone(get_replica_set())
+
+    def test_sync_without_replicas(self) -> None:
+        app = ca("codeapp.config.TestingConfig")
+        with app.app_context():
+            self.assertIsNone(get_replica_set())
+            self.assertEqual(sync_sqlite_replicas(), 0)
+
+
+class TestUnreachableReplicas(TestCase):
+    def create_app(self) -> Flask:
+        os.environ["FLASK_ENV"] = "testing"
+        with patch(
+            "codeapp.config.TestingReplicaConfig.SQLALCHEMY_REPLICA_URIS",
+            [
+                "sqlite:////missing/replica-0.db",
+                "sqlite:////missing/replica-1.db",
+            ],
+        ):
+            app = ca("codeapp.config.TestingReplicaConfig")
+        return app
+
+    def test_falls_back_to_primary(self) -> None:
+        _user = load_user("1")
+        assert _user is not None
+        self.assertEqual(_user.email, "default@chalmers.se")
+
+
+if __name__ == "__main__":
+    logging.fatal("This file cannot be run directly. Run `pytest` instead.")
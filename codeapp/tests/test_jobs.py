@@ -0,0 +1,208 @@
+import logging
+import os
+from typing import List
+from unittest.mock import MagicMock, patch
+
+from flask import Flask
+from sqlalchemy import delete, select, text, update
+
+from codeapp import create_app as ca
+from codeapp import db
+from codeapp.jobs import Worker, get_job_queue, job, registry, run_job
+from codeapp.models import User
+from codeapp.tasks import send_welcome_email
+
+from .utils import TestCase
+
+calls: List[int] = []
+
+
+@job(max_attempts=2)
+def flaky(value: int) -> None:
+    calls.append(value)
+    raise ValueError("Mock error")
+
+
+@job(max_attempts=1)
+def broken_transaction() -> None:
+    # leaves the session of the worker in a failed transaction
+    db.session.add(User(name="Copy", email="default@chalmers.se", password="x"))
+    db.session.flush()
+
+
+@job(max_attempts=1)
+def query() -> None:
+    calls.append(db.session.execute(text("SELECT 1")).scalar_one())
+
+
+class TestJobs(TestCase):
+    def setUp(self) -> None:
+        self.queue = get_job_queue()
+        with self.queue.engine.begin() as conn:
+            conn.execute(delete(self.queue.table))
+        calls.clear()
+
+    def status(self, job_id: int) -> str:
+        with self.queue.engine.connect() as conn:
+            status: str = conn.execute(
+                select(self.queue.table.c.status).where(
+                    self.queue.table.c.id == job_id
+                )
+            ).scalar_one()
+        return status
+
+    def test_delay_and_run(self) -> None:
+        job_id = send_welcome_email.delay(
+            name="Testing User", email="xyz@chalmers.se"
+        )
+        self.assertEqual(self.status(job_id), "queued")
+        with self.assertLogs(self.app.logger, "INFO") as logs:
+            self.assertEqual(Worker(burst=True).run(), 1)
+        self.assertIn("xyz@chalmers.se", "".join(logs.output))
+        self.assertEqual(self.status(job_id), "done")
+
+    def test_call_directly(self) -> None:
+        with self.assertRaises(ValueError):
+            flaky(value=1)
+        self.assertEqual(calls, [1])
+        self.assertIs(registry[flaky.name], flaky)
+
+    def test_countdown(self) -> None:
+        send_welcome_email.delay(countdown=60, name="Later", email="x@y.se")
+        self.assertIsNone(self.queue.claim())
+
+    def test_retry_with_backoff(self) -> None:
+        job_id = flaky.delay(value=2)
+        self.assertEqual(Worker(burst=True).run(), 1)
+        # the second attempt waits for the backoff
+        self.assertEqual(self.status(job_id), "queued")
+        self.assertIsNone(self.queue.claim())
+        with self.queue.engine.begin() as conn:
+            conn.execute(update(self.queue.table).values(run_at=0))
+        self.assertEqual(Worker(burst=True).run(), 1)
+        self.assertEqual(self.status(job_id), "failed")
+        self.assertEqual(calls, [2, 2])
+
+    def test_backoff(self) -> None:
+        self.assertEqual(self.queue.backoff(0), 2.0)
+        self.assertEqual(self.queue.backoff(3), 8.0)
+        self.assertEqual(self.queue.backoff(100), self.queue.backoff_max)
+
+    def test_unknown_job(self) -> None:
+        job_id = self.queue.enqueue("codeapp.missing", {}, max_attempts=1)
+        _job = self.queue.claim()
+        assert _job is not None
+        self.assertFalse(run_job(_job))
+        self.assertEqual(self.status(job_id), "failed")
+
+    def test_requeue_stale(self) -> None:
+        job_id = flaky.delay(value=3)
+        self.assertIsNotNone(self.queue.claim())
+        self.assertEqual(self.queue.requeue_stale(), 0)
+        with self.queue.engine.begin() as conn:
+            conn.execute(update(self.queue.table).values(locked_at=0))
+        self.assertEqual(self.queue.requeue_stale(), 1)
+        self.assertEqual(self.status(job_id), "queued")
+
+        # the second worker to die with it used its last attempt
+        self.assertIsNotNone(self.queue.claim())
+        with self.queue.engine.begin() as conn:
+            conn.execute(update(self.queue.table).values(locked_at=0))
+        self.assertEqual(self.queue.requeue_stale(), 0)
+        self.assertEqual(self.status(job_id), "failed")
+
+    def test_failed_job_does_not_break_the_next_one(self) -> None:
+        broken_transaction.delay()
+        query.delay()
+        self.assertEqual(Worker(burst=True).run(), 2)
+        self.assertEqual(calls, [1])
+
+    def test_claimed_by_another_worker(self) -> None:
+        # the row found by the `SELECT` is claimed by another worker
+        # before the `UPDATE`, so this worker looks for the next one
+        conn = MagicMock()
+        conn.execute.return_value.mappings.return_value.first.side_effect = [
+            {"id": 1},
+            None,
+        ]
+        conn.execute.return_value.rowcount = 0
+        with patch.object(self.queue, "engine") as mock_engine:
+            mock_engine.begin.return_value.__enter__.return_value = conn
+            self.assertIsNone(self.queue.claim())
+        self.assertEqual(mock_engine.begin.call_count, 2)
+
+    def test_worker_polls_until_stopped(self) -> None:
+        _worker = Worker(poll_interval=0.0)
+        with patch("codeapp.jobs.time.sleep", side_effect=_worker.stop):
+            self.assertEqual(_worker.run(), 0)
+
+    def test_register_when_queueing_fails(self) -> None:
+        with patch(
+            "codeapp.routes.db.session.add",
+            autospec=True,
+            spec_set=True,
+        ), patch(
+            "codeapp.routes.db.session.commit",
+            autospec=True,
+            spec_set=True,
+        ), patch.object(
+            send_welcome_email, "delay", side_effect=RuntimeError("Mock error")
+        ), self.assertLogs(
+            self.app.logger, "ERROR"
+        ):
+            response = self.client.post(
+                "/register",
+                data={
+                    "name": "Unqueued User",
+                    "email": "unqueued@chalmers.se",
+                    "password": "testing",
+                    "confirm_password": "testing",
+                },
+            )
+        # the user was created, so the registration still succeeds
+        self.assertStatus(response, 302)
+        self.assertTrue(response.location.endswith("/login"))
+
+    def test_register_queues_welcome_email(self) -> None:
+        with patch(
+            "codeapp.routes.db.session.add",
+            autospec=True,
+            spec_set=True,
+        ), patch(
+            "codeapp.routes.db.session.commit",
+            autospec=True,
+            spec_set=True,
+        ):
+            self.client.post(
+                "/register",
+                data={
+                    "name": "Queued User",
+                    "email": "queued@chalmers.se",
+                    "password": "testing",
+                    "confirm_password": "testing",
+                },
+            )
+        _job = self.queue.claim()
+        assert _job is not None
+        self.assertEqual(_job.name, send_welcome_email.name)
+
+
+class TestJobsDatabase(TestCase):
+    def create_app(self) -> Flask:
+        os.environ["FLASK_ENV"] = "testing"
+        with patch(
+            "codeapp.config.TestingConfig.JOBS_DATABASE_URI",
+            "sqlite:///site-testing-jobs.db",
+        ):
+            app = ca("codeapp.config.TestingConfig")
+        return app
+
+    def test_separate_database(self) -> None:
+        queue = get_job_queue()
+        self.assertIn("site-testing-jobs.db", str(queue.engine.url))
+        job_id = flaky.delay(value=6)
+        self.assertGreater(job_id, 0)
+
+
+if __name__ == "__main__":
+    logging.fatal("This file cannot be run directly. Run `pytest` instead.")
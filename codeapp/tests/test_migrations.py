@@ -0,0 +1,165 @@
+import logging
+import os
+from typing import List
+from unittest.mock import patch
+
+from flask import Flask
+from sqlalchemy import (
+    Column,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    func,
+    insert,
+    select,
+)
+
+from codeapp import create_app as ca
+from codeapp import db
+from codeapp.migrations import (
+    MigrationContext,
+    applied_versions,
+    load_migrations,
+    migrate,
+    migration_progress,
+    pending_migrations,
+    schema_drift,
+    stamp,
+)
+from codeapp.migrations.v0001_initial import user
+from codeapp.models import load_user
+
+from .utils import TestCase
+
+
+class TestMigrations(TestCase):
+    def create_app(self) -> Flask:
+        os.environ["FLASK_ENV"] = "testing"
+        app = ca("codeapp.config.TestingMigrationConfig")
+        return app
+
+    def setUp(self) -> None:
+        # starts from an empty database
+        existing = MetaData()
+        existing.reflect(db.engine)
+        existing.drop_all(db.engine)
+        self.messages: List[str] = []
+
+    def context(self, version: str = "9999") -> MigrationContext:
+        return MigrationContext(
+            version, batch_size=2, pause=0.0, echo=self.messages.append
+        )
+
+    def test_migrate_from_empty_database(self) -> None:
+        self.assertEqual(
+            [migration.version for migration in pending_migrations()],
+            ["0001", "0002", "0003"],
+        )
+        self.assertIn("missing table user (engine 0)", schema_drift())
+
+        self.assertEqual(
+            migrate(echo=self.messages.append), ["0001", "0002", "0003"]
+        )
+        self.assertEqual(self.messages[0], "Applying 0001 initial...")
+        self.assertEqual(pending_migrations(), [])
+        # the migrations build exactly what the models describe
+        self.assertEqual(schema_drift(), [])
+        self.assertEqual(migrate(echo=self.messages.append), [])
+
+    def test_migrate_baseline_database(self) -> None:
+        # the schema built by `recreate_db` before the migrations existed
+        baseline = MetaData()
+        Table(
+            "user",
+            baseline,
+            Column("id", Integer(), primary_key=True, autoincrement=True),
+            Column("name", String(128), nullable=False),
+            Column("email", String(128), unique=True, nullable=False),
+            Column("password", String(128), nullable=False),
+        )
+        baseline.create_all(db.engine)
+        with db.engine.begin() as conn:
+            conn.execute(
+                insert(user).values(
+                    name="Default User",
+                    email="default@chalmers.se",
+                    password="x",
+                )
+            )
+
+        migrate(echo=self.messages.append)
+        self.assertEqual(schema_drift(), [])
+        _user = load_user("1")
+        assert _user is not None
+        self.assertEqual(_user.version, 1)
+
+    def test_migrations_can_run_again(self) -> None:
+        migrate(echo=self.messages.append)
+        # e.g., after a release that failed before recording them
+        for migration in load_migrations():
+            migration.upgrade(self.context(migration.version))
+        self.assertEqual(schema_drift(), [])
+
+    def test_drift_is_reported(self) -> None:
+        initial, *_ = load_migrations()
+        initial.upgrade(self.context())
+        self.assertCountEqual(
+            schema_drift(),
+            [
+                "missing column last_seen_at in user (engine 0)",
+                "missing table login_event (engine 0)",
+                "missing table server_session (engine 0)",
+            ],
+        )
+
+    def test_stamp(self) -> None:
+        db.metadata.create_all(db.engine)
+        self.assertEqual(stamp(), 3)
+        self.assertEqual(applied_versions(), {"0001", "0002", "0003"})
+        self.assertEqual(stamp(), 0)
+
+    def test_backfill_resumes(self) -> None:
+        migrate(echo=self.messages.append)
+        with db.engine.begin() as conn:
+            for idx in range(5):
+                conn.execute(
+                    insert(user).values(
+                        name="User",
+                        email=f"user{idx}@chalmers.se",
+                        password="x",
+                    )
+                )
+        table = db.metadata.tables["user"]
+        ctx = self.context()
+        # interrupted after the first batch
+        with patch(
+            "codeapp.migrations.time.sleep", side_effect=KeyboardInterrupt
+        ):
+            with self.assertRaises(KeyboardInterrupt):
+                ctx.backfill(table, {"last_seen_at": 1.0})
+        with db.engine.connect() as conn:
+            cursor = conn.execute(select(migration_progress.c.cursor)).scalar()
+        self.assertEqual(cursor, 2)
+
+        # resumes after the rows already updated
+        self.assertEqual(
+            ctx.backfill(
+                table,
+                {"last_seen_at": 1.0},
+                where=lambda t: t.c.last_seen_at.is_(None),
+            ),
+            3,
+        )
+        self.assertEqual(self.messages[-1], "  user: 3 row(s) updated")
+        with db.engine.connect() as conn:
+            self.assertEqual(
+                conn.execute(
+                    select(func.count()).where(table.c.last_seen_at == 1.0)
+                ).scalar(),
+                5,
+            )
+
+
+if __name__ == "__main__":
+    logging.fatal("This file cannot be run directly. Run `pytest` instead.")
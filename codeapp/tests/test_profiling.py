@@ -0,0 +1,97 @@
+import logging
+import os
+import shutil
+import tempfile
+import tracemalloc
+
+from flask import Flask
+
+from codeapp import create_app as ca
+from codeapp.profiling import Profile, ProfilerMiddleware, profile_route
+
+from .utils import TestCase
+
+
+def busy() -> int:
+    return sum(i * i for i in range(200_000))
+
+
+class TestProfiling(TestCase):
+    def create_app(self) -> Flask:
+        os.environ["FLASK_ENV"] = "testing"
+        app = ca("codeapp.config.TestingProfileConfig")
+        return app
+
+    def setUp(self) -> None:
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.directory)
+
+    def test_sampler(self) -> None:
+        with Profile("sample") as profile:
+            busy()
+        self.assertIn("test_profiling:busy", profile.sampler.collapsed())
+        (path,) = profile.write(self.directory, "busy")
+        self.assertTrue(path.endswith("busy.folded"))
+
+    def test_cprofile_and_memory(self) -> None:
+        with Profile("cprofile", memory=True) as profile:
+            _ = [str(i) for i in range(10_000)]
+        paths = profile.write(self.directory, "memory")
+        self.assertEqual(
+            [os.path.basename(path) for path in paths],
+            ["memory.prof", "memory.alloc.txt"],
+        )
+        with open(paths[1], encoding="utf-8") as file:
+            self.assertIn("test_profiling.py", file.read())
+
+    def test_memory_already_traced(self) -> None:
+        # e.g., two profiles nested, or started by another thread
+        with Profile("sample", memory=True) as outer:
+            with Profile("sample", memory=True) as inner:
+                _ = [str(i) for i in range(1_000)]
+            self.assertTrue(tracemalloc.is_tracing())
+            self.assertIsNotNone(inner.snapshot)
+        self.assertIsNotNone(outer.snapshot)
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_unknown_mode(self) -> None:
+        with self.assertRaises(ValueError):
+            Profile("perf")
+
+    def test_profile_route(self) -> None:
+        profile = profile_route(
+            self.app,
+            "bp.profile",
+            number=3,
+            login=("default@chalmers.se", "testing"),
+            mode="cprofile",
+        )
+        self.assertGreater(profile.elapsed, 0)
+        stats = profile.profiler.getstats()
+        names = {getattr(stat.code, "co_name", "") for stat in stats}
+        self.assertIn("profile", names)
+
+    def test_live_request(self) -> None:
+        middleware = self.app.wsgi_app
+        assert isinstance(middleware, ProfilerMiddleware)
+        middleware.directory = self.directory
+        self.assert200(self.client.get("/about"))
+        self.assert200(self.client.get("/about", headers={"X-Profile": "x"}))
+        self.assert200(
+            self.client.get("/about", headers={"X-Profile": "tésting"})
+        )
+        self.assertEqual(os.listdir(self.directory), [])
+
+        response = self.client.get("/about", headers={"X-Profile": "testing"})
+        self.assert200(response)
+        self.assertIn("About", response.data.decode())
+        self.assertEqual(
+            sorted(name.split("-")[-1] for name in os.listdir(self.directory)),
+            ["about.alloc.txt", "about.folded"],
+        )
+
+
+if __name__ == "__main__":
+    logging.fatal("This file cannot be run directly. Run `pytest` instead.")
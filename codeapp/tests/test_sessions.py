@@ -0,0 +1,226 @@
+import logging
+import os
+import time
+
+from flask import Flask, g
+from sqlalchemy import func, select
+
+from codeapp import create_app as ca
+from codeapp import db
+from codeapp.models import ServerSession
+from codeapp.sessions import (
+    ServerSideSessionInterface,
+    SessionStore,
+    StoredSession,
+    get_session_store,
+)
+
+from .utils import TestCase
+
+
+class TestSessions(TestCase):
+    def create_app(self) -> Flask:
+        os.environ["FLASK_ENV"] = "testing"
+        app = ca("codeapp.config.TestingSessionConfig")
+        return app
+
+    def setUp(self) -> None:
+        self.store = get_session_store(self.app)
+        with self.store.engine.begin() as conn:
+            conn.execute(ServerSession.__table__.delete())  # type: ignore[attr-defined]
+
+    def cookie(self) -> str:
+        cookie = self.client.get_cookie("session")
+        assert cookie is not None
+        return str(cookie.value)
+
+    def count_sessions(self) -> int:
+        with self.store.engine.connect() as conn:
+            count: int = conn.execute(
+                select(func.count()).select_from(ServerSession)
+            ).scalar_one()
+        return count
+
+    def profile_status(self) -> int:
+        # the test client shares `g` between requests,
+        # so the user cached by Flask-Login is dropped by hand
+        g.pop("_login_user", None)
+        status: int = self.client.get("/profile").status_code
+        return status
+
+    def login(self) -> None:
+        self.client.post(
+            "/login",
+            data={"email": "default@chalmers.se", "password": "testing"},
+        )
+
+    def test_cookie_only_holds_the_id(self) -> None:
+        # anonymous pages do not create sessions
+        self.assert200(self.client.get("/about"))
+        self.assertIsNone(self.client.get_cookie("session"))
+        self.assertEqual(self.count_sessions(), 0)
+
+        self.login()
+        sid, version, _ = self.cookie().split(".")
+        self.assertEqual(version, "1")
+        self.assertLess(len(self.cookie()), 80)
+        self.assertEqual(self.count_sessions(), 1)
+        # stored in its own database
+        self.assertNotEqual(self.store.engine.url, db.engine.url)
+
+        # the welcome message is consumed, which writes the session again
+        self.assertIn("Welcome!", self.client.get("/").data.decode())
+        self.assertEqual(self.cookie().split(".")[:2], [sid, "2"])
+        # unchanged sessions are neither written nor sent back
+        response = self.client.get("/profile")
+        self.assert200(response)
+        self.assertNotIn("Set-Cookie", response.headers)
+        self.assertEqual(response.headers["Vary"], "Cookie")
+
+    def test_session_written_by_another_process(self) -> None:
+        self.login()
+        sid, _, _ = self.cookie().split(".")
+        # another process has the first version in memory
+        other = SessionStore(self.store.engine)
+        stored = other.get(sid, 1)
+        assert stored is not None
+        self.client.get("/")
+        self.assertEqual(other.get(sid, 2), self.store.get(sid, 2))
+        self.assertIsNone(other.get("unknown", 1))
+
+    def test_concurrent_writes(self) -> None:
+        self.login()
+        sid, _, _ = self.cookie().split(".")
+        # another request of the same client saves version 2 first
+        other = SessionStore(self.store.engine)
+        self.assertTrue(
+            other.put(sid, StoredSession(2, "{}", time.time() + 60), 1)
+        )
+        # consuming the welcome message would also write version 2
+        with self.assertLogs(self.app.logger, "INFO") as logs:
+            response = self.client.get("/")
+        self.assertIn("concurrent request", "".join(logs.output))
+        self.assertNotIn("Set-Cookie", response.headers)
+        # the version that was written first is kept
+        stored = self.store.get(sid, 2)
+        assert stored is not None
+        self.assertEqual(stored.data, "{}")
+
+    def test_stale_cookie(self) -> None:
+        self.login()
+        stale = self.client.get_cookie("session")
+        assert stale is not None
+        # the browser misses the cookie of the next write
+        self.client.get("/")
+        self.client.set_cookie("session", stale.value)
+        # the stored version is sent back, without writing the session
+        response = self.client.get("/about")
+        sid, version, _ = self.cookie().split(".")
+        self.assertEqual(version, "2")
+        self.assertIn("Set-Cookie", response.headers)
+
+        # the next writes persist
+        self.client.set_cookie("session", stale.value)
+        with self.client.session_transaction() as session:
+            session["first"] = True
+        with self.client.session_transaction() as session:
+            session["second"] = True
+        self.assertEqual(self.cookie().split(".")[:2], [sid, "4"])
+        stored = self.store.get(sid, 4)
+        assert stored is not None
+        self.assertIn("second", stored.data)
+        self.assertIn("first", stored.data)
+
+    def test_expiry(self) -> None:
+        self.login()
+        sid, _, _ = self.cookie().split(".")
+        stored = self.store.get(sid, 1)
+        assert stored is not None
+        # less than half of the lifetime left: the expiry is pushed back
+        self.store.put(
+            sid, stored._replace(expires_at=time.time() + 60), stored.version
+        )
+        self.client.get("/about")
+        self.assertEqual(self.cookie().split(".")[1], "2")
+
+        stored = self.store.get(sid, 2)
+        assert stored is not None
+        self.store.put(
+            sid, stored._replace(expires_at=time.time() - 1), stored.version
+        )
+        self.assertEqual(self.profile_status(), 302)
+        self.assertEqual(self.store.delete_expired(), 1)
+
+        # expired sessions are also deleted when a session is written
+        self.store.put("expired", StoredSession(1, "{}", time.time() - 1))
+        self.store.cleanup_interval = 0
+        self.login()
+        # only the session of the new login is left
+        self.assertEqual(self.count_sessions(), 1)
+
+    def test_invalid_cookies(self) -> None:
+        self.login()
+        sid, version, signature = self.cookie().split(".")
+        for value in (f"{sid}.{version}.x", f"{sid}.{version}", "x"):
+            self.client.set_cookie("session", value)
+            self.assertEqual(self.profile_status(), 302)
+
+        self.app.config["SESSION_USE_SIGNER"] = False
+        self.client.set_cookie("session", f"{sid}.{version}")
+        self.assertEqual(self.profile_status(), 200)
+        self.client.set_cookie("session", f"{sid}.x")
+        self.assertEqual(self.profile_status(), 302)
+        self.assertTrue(signature)
+
+    def test_id_changes_on_login_and_logout(self) -> None:
+        # an id planted in the browser before the login
+        with self.client.session_transaction() as session:
+            session["planted"] = True
+        planted, _, _ = self.cookie().split(".")
+
+        self.login()
+        sid, version, _ = self.cookie().split(".")
+        self.assertNotEqual(sid, planted)
+        self.assertEqual(version, "1")
+        self.assertIsNone(self.store.get(planted, 1))
+        self.assertEqual(self.count_sessions(), 1)
+
+        self.client.get("/logout")
+        new_sid, _, _ = self.cookie().split(".")
+        self.assertNotEqual(new_sid, sid)
+        self.assertIsNone(self.store.get(sid, 1))
+        self.assertEqual(self.count_sessions(), 1)
+
+    def test_cleared_session_is_deleted(self) -> None:
+        self.login()
+        with self.client.session_transaction() as session:
+            session.clear()
+        self.assertEqual(self.count_sessions(), 0)
+        self.assertIsNone(self.client.get_cookie("session"))
+
+    def test_permanent(self) -> None:
+        self.app.config["SESSION_PERMANENT"] = True
+        self.login()
+        cookie = self.client.get_cookie("session")
+        assert cookie is not None
+        self.assertIsNotNone(cookie.expires)
+
+    def test_cache_size(self) -> None:
+        # pylint: disable=protected-access
+        self.store.put("a", StoredSession(1, "{}", time.time() + 60))
+        self.store.put("b", StoredSession(1, "{}", time.time() + 60))
+        self.assertEqual(list(self.store._cache), ["b"])
+        self.assertIsNotNone(self.store.get("a", 1))
+
+    def test_without_secret_key(self) -> None:
+        self.app.secret_key = None
+        with self.app.test_request_context():
+            self.assertIsNone(
+                ServerSideSessionInterface().open_session(
+                    self.app, self.app.request_class({})
+                )
+            )
+
+
+if __name__ == "__main__":
+    logging.fatal("This file cannot be run directly. Run `pytest` instead.")
@@ -0,0 +1,226 @@
+import logging
+import os
+from unittest.mock import patch
+
+from flask import Flask
+from sqlalchemy import create_engine, delete, func, insert, select
+
+from codeapp import bcrypt
+from codeapp import create_app as ca
+from codeapp import db
+from codeapp.activity import get_activity_buffer
+from codeapp.migrations import MigrationContext
+from codeapp.models import LoginEvent, SessionUser, User, load_user
+from codeapp.sharding import (
+    create_shard_schemas,
+    decode_user_id,
+    encode_user_id,
+    get_shard_set,
+    normalize_email,
+    rebalance_shards,
+    shard_index,
+)
+
+from .utils import TestCase
+
+
+class TestSharding(TestCase):
+    def create_app(self) -> Flask:
+        os.environ["FLASK_ENV"] = "testing"
+        app = ca("codeapp.config.TestingShardConfig")
+        return app
+
+    def setUp(self) -> None:
+        self.assertEqual(create_shard_schemas(db.metadata, drop=True), 2)
+        shards = get_shard_set()
+        assert shards is not None
+        self.shards = shards
+        pwd = bcrypt.generate_password_hash("testing").decode("utf-8")
+        db.session.add(
+            User(name="Default User", email="default@chalmers.se", password=pwd)
+        )
+        db.session.commit()
+
+    def count_users(self, shard: int) -> int:
+        with self.shards.engines[shard].connect() as conn:
+            count: int = conn.execute(
+                select(func.count()).select_from(User.__table__)
+            ).scalar_one()
+        return count
+
+    def test_shard_index_is_stable(self) -> None:
+        self.assertEqual(
+            normalize_email(" Default@Chalmers.SE "), "default@chalmers.se"
+        )
+        self.assertEqual(
+            shard_index("Default@Chalmers.se", 2),
+            shard_index("default@chalmers.se", 2),
+        )
+        self.assertEqual(shard_index("default@chalmers.se", 1), 0)
+
+    def test_insert_goes_to_one_shard(self) -> None:
+        shard = self.shards.index_for("default@chalmers.se")
+        self.assertEqual(self.count_users(shard), 1)
+        self.assertEqual(self.count_users(1 - shard), 0)
+
+    def test_login_and_load_user(self) -> None:
+        response = self.client.post(
+            "/login",
+            data={"email": "default@chalmers.se", "password": "testing"},
+        )
+        self.assertStatus(response, 302)
+        self.assertMessageFlashed("Welcome!", "success")
+
+        shard = self.shards.index_for("default@chalmers.se")
+        _user = load_user(f"{shard}-1")
+        self.assertIsInstance(_user, SessionUser)
+        assert _user is not None
+        self.assertEqual(_user.get_id(), f"{shard}-1")
+        self.assertIsNone(load_user(f"{1 - shard}-1"))
+
+    def test_invalid_user_ids(self) -> None:
+        self.assertIsNone(load_user("1"))
+        self.assertIsNone(load_user("x-1"))
+        self.assertIsNone(load_user("7-1"))
+        self.assertEqual(decode_user_id("1-3"), (1, 3))
+
+    def test_sign_up_existing_email(self) -> None:
+        # the check for an existing email only looks in the user's shard
+        data = {"name": "Testing User", "email": "default@chalmers.se"}
+        data["password"] = data["confirm_password"] = "testing"
+        response = self.client.post("/register", data=data)
+        self.assertTemplateUsed("register.html")
+        self.assertIn(
+            "This email is already registered.", response.data.decode()
+        )
+
+    def test_rebalance(self) -> None:
+        # places rows in the wrong shard, as if a shard had been added
+        emails = [f"user{idx}@chalmers.se" for idx in range(6)]
+        for email in emails:
+            wrong = 1 - self.shards.index_for(email)
+            with self.shards.engines[wrong].begin() as conn:
+                conn.execute(
+                    insert(User.__table__).values(
+                        name="User", email=email, password="x"
+                    )
+                )
+        # interrupted run: a copy already exists in the right shard
+        right = self.shards.index_for(emails[0])
+        with self.shards.engines[right].begin() as conn:
+            conn.execute(
+                insert(User.__table__).values(
+                    name="User", email=emails[0], password="x"
+                )
+            )
+
+        self.assertEqual(rebalance_shards(db.metadata, batch_size=2), 6)
+        self.assertEqual(rebalance_shards(db.metadata), 0)
+        self.assertEqual(self.count_users(0) + self.count_users(1), 7)
+
+    def test_rebalance_from_primary(self) -> None:
+        # a database written before sharding was enabled
+        primary = create_engine("sqlite://")
+        User.__table__.create(primary)
+        with primary.begin() as conn:
+            for idx in range(3):
+                conn.execute(
+                    insert(User.__table__).values(
+                        name="User", email=f"old{idx}@chalmers.se", password="x"
+                    )
+                )
+        self.assertEqual(
+            rebalance_shards(db.metadata, batch_size=2, primary=primary), 3
+        )
+        with primary.connect() as conn:
+            self.assertEqual(
+                conn.execute(
+                    select(func.count()).select_from(User.__table__)
+                ).scalar_one(),
+                0,
+            )
+        self.assertEqual(self.count_users(0) + self.count_users(1), 4)
+        for idx in range(3):
+            email = f"old{idx}@chalmers.se"
+            with self.shards.engine_for(email).connect() as conn:
+                self.assertIsNotNone(
+                    conn.execute(
+                        select(User.id).where(User.email == email)
+                    ).first()
+                )
+        # without the table, there is nothing to drain
+        self.assertEqual(
+            rebalance_shards(db.metadata, primary=create_engine("sqlite://")),
+            0,
+        )
+
+    def test_moved_ids_are_not_reused(self) -> None:
+        buffer = get_activity_buffer()
+        assert buffer is not None
+        email = "moved@chalmers.se"
+        wrong = 1 - self.shards.index_for(email)
+        with self.shards.engines[wrong].begin() as conn:
+            (local_id,) = conn.execute(
+                insert(User.__table__).values(
+                    name="User", email=email, password="x"
+                )
+            ).inserted_primary_key or (0,)
+        old_id = encode_user_id(wrong, local_id)
+        events = LoginEvent.__table__  # type: ignore[attr-defined]
+        with db.engine.begin() as conn:
+            conn.execute(insert(events).values(user_id=old_id, created_at=1.0))
+        try:
+            self.assertEqual(
+                rebalance_shards(db.metadata, on_move=buffer.move_user), 1
+            )
+            # the login history follows the user
+            with db.engine.connect() as conn:
+                new_id = conn.execute(
+                    select(events.c.user_id).where(events.c.created_at == 1.0)
+                ).scalar_one()
+            _user = load_user(new_id)
+            assert _user is not None
+            self.assertEqual(_user.email, email)
+        finally:
+            with db.engine.begin() as conn:
+                conn.execute(delete(events).where(events.c.created_at == 1.0))
+
+        # a session still holding the old id is logged out,
+        # even after another user is written to the same shard
+        with self.shards.engines[wrong].begin() as conn:
+            (reused_id,) = conn.execute(
+                insert(User.__table__).values(
+                    name="User", email="next@chalmers.se", password="x"
+                )
+            ).inserted_primary_key or (0,)
+        self.assertNotEqual(reused_id, local_id)
+        self.assertIsNone(load_user(old_id))
+
+    def test_last_seen_goes_to_shard(self) -> None:
+        shard = self.shards.index_for("default@chalmers.se")
+        buffer = get_activity_buffer()
+        assert buffer is not None
+        buffer.touch(SessionUser(1, "Default User", "", shard=shard), 1000.0)
+        self.assertEqual(buffer.flush(), 1)
+        with self.shards.engines[shard].connect() as conn:
+            self.assertEqual(
+                conn.execute(select(User.last_seen_at)).scalar_one(), 1000.0
+            )
+
+    def test_migrations_run_on_shards(self) -> None:
+        self.assertEqual(
+            MigrationContext.engines_for("user"), self.shards.engines
+        )
+        self.assertEqual(MigrationContext.engines_for("job"), [db.engine])
+
+    def test_not_sharded(self) -> None:
+        app = ca("codeapp.config.TestingConfig")
+        with app.app_context():
+            self.assertEqual(create_shard_schemas(db.metadata), 0)
+            self.assertEqual(rebalance_shards(db.metadata), 0)
+        with patch("codeapp.sharding.has_app_context", return_value=False):
+            self.assertIsNone(get_shard_set())
+
+
+if __name__ == "__main__":
+    logging.fatal("This file cannot be run directly. Run `pytest` instead.")
@@ -1,6 +1,10 @@
 import logging
 from unittest.mock import patch
 
+from sqlalchemy import inspect
+
+from codeapp.models import SessionUser, User, load_user
+
 from .utils import TestCase
 
 
@@ -190,6 +194,30 @@ class TestUser(TestCase):
             self.assertTemplateUsed("register.html")
             self.assertIn("There was an error", response.data.decode())
 
+    def test_load_user(self) -> None:
+        _user = load_user("1")
+        self.assertIsInstance(_user, SessionUser)
+        assert _user is not None
+        self.assertEqual(_user.get_id(), "1")
+        self.assertEqual(_user.email, "default@chalmers.se")
+        self.assertIn("default@chalmers.se", repr(_user))
+        self.assertEqual(_user, load_user("1"))
+        self.assertNotEqual(_user, "1")
+        self.assertEqual(hash(_user), hash(load_user("1")))
+        self.assertIsNone(load_user("0"))
+        self.assertIsNone(load_user("x"))
+
+    def test_session_user_read_only(self) -> None:
+        _user = SessionUser(1, "Name", "name@chalmers.se")
+        with self.assertRaises(AttributeError):
+            _user.name = "Other"
+        with self.assertRaises(AttributeError):
+            del _user.name
+        self.assertFalse(hasattr(_user, "__dict__"))
+
+    def test_password_deferred(self) -> None:
+        self.assertTrue(inspect(User).attrs.password.deferred)
+
 
 if __name__ == "__main__":
     logging.fatal("This file cannot be run directly. Run `pytest` instead.")
@@ -1,11 +1,25 @@
 # built-in imports
+import signal
+import sys
+import timeit
+from typing import Optional, Tuple
 
 # external imports
+import click
 from flask.cli import FlaskGroup
 
 # internal imports
-from codeapp import bcrypt, create_app, db
+from codeapp import bcrypt, create_app, db, limiter
+from codeapp.activity import get_activity_buffer
+from codeapp.database import sync_sqlite_replicas
+from codeapp.forms import LoginForm
+from codeapp.jobs import Worker
+from codeapp.migrations import migrate as run_migrations
+from codeapp.migrations import pending_migrations, schema_drift, stamp
 from codeapp.models import User
+from codeapp.profiling import MODES, profile_route
+from codeapp.schemas import login_schema
+from codeapp.sharding import create_shard_schemas, rebalance_shards
 
 app = create_app()
 cli = FlaskGroup(create_app=create_app)  # type: ignore
@@ -16,6 +30,7 @@ def recreate_db() -> None:
     with app.app_context():
         db.drop_all()
         db.create_all()
+        create_shard_schemas(db.metadata, drop=True)
         pwd = bcrypt.generate_password_hash("testing").decode("utf-8")
         default_1 = User(
             name="Default User",
@@ -24,6 +39,149 @@ def recreate_db() -> None:
         )
         db.session.add(default_1)
         db.session.commit()
+        # the tables match the models, so no migration is left to run
+        stamp()
+        sync_sqlite_replicas()
+
+
+@cli.command("migrate")  # type: ignore
+def migrate() -> None:
+    """Applies the pending migrations. Run on every release."""
+    with app.app_context():
+        applied = run_migrations()
+        print(f"{len(applied)} migration(s) applied.")
+        sync_sqlite_replicas()
+
+
+@cli.command("check_migrations")  # type: ignore
+def check_migrations() -> None:
+    """
+    Fails when migrations are pending or when the database does not match
+    the models, e.g., because a model changed without a migration.
+    """
+    with app.app_context():
+        pending = pending_migrations()
+        for migration in pending:
+            print(f"pending: {migration.version} {migration.name}")
+        problems = [] if pending else schema_drift()
+        for problem in problems:
+            print(problem)
+        if pending or problems:
+            sys.exit(1)
+        print("The database is up to date.")
+
+
+@cli.command("sync_replicas")  # type: ignore
+def sync_replicas() -> None:
+    with app.app_context():
+        copied = sync_sqlite_replicas()
+        print(f"{copied} SQLite replica(s) synchronized.")
+
+
+@cli.command("create_shards")  # type: ignore
+def create_shards() -> None:
+    with app.app_context():
+        count = create_shard_schemas(db.metadata)
+        print(f"Sharded tables created in {count} shard(s).")
+
+
+@cli.command("rebalance_shards")  # type: ignore
+def rebalance() -> None:
+    with app.app_context():
+        buffer = get_activity_buffer()
+        # also drains the rows written before sharding was enabled
+        moved = rebalance_shards(
+            db.metadata,
+            primary=db.engine,
+            on_move=None if buffer is None else buffer.move_user,
+        )
+        print(f"{moved} row(s) moved to their shard.")
+        if moved:
+            print("The users moved have to log in again.")
+
+
+@cli.command("worker")  # type: ignore
+@click.option("--burst", is_flag=True, help="Stop once there are no jobs left.")
+@click.option(
+    "--poll-interval",
+    default=1.0,
+    show_default=True,
+    help="Seconds to wait when there are no jobs.",
+)
+def worker(burst: bool, poll_interval: float) -> None:
+    # run as many worker processes as needed to keep up with the queue
+    with app.app_context():
+        _worker = Worker(poll_interval=poll_interval, burst=burst)
+        # finishes the current job before stopping
+        signal.signal(signal.SIGTERM, _worker.stop)
+        signal.signal(signal.SIGINT, _worker.stop)
+        count = _worker.run()
+        print(f"{count} job(s) run.")
+
+
+@cli.command("benchmark_validation")  # type: ignore
+@click.option("--number", default=5000, show_default=True)
+def benchmark_validation(number: int) -> None:
+    """Compares the validation of a login with the form and the schema."""
+    payload = {"email": "default@chalmers.se", "password": "testing"}
+    with app.test_request_context("/login", method="POST", data=payload):
+        form_time = timeit.timeit(lambda: LoginForm().validate(), number=number)
+    with app.test_request_context("/api/login", method="POST", json=payload):
+        schema_time = timeit.timeit(
+            lambda: login_schema.validate(payload), number=number
+        )
+    print(f"form:   {form_time / number * 1e6:8.1f} us per request")
+    print(f"schema: {schema_time / number * 1e6:8.1f} us per request")
+    print(
+        f"saving: {(form_time - schema_time) / number * 1e6:8.1f} us per request"
+    )
+
+
+@cli.command("profile")  # type: ignore
+@click.argument("target")
+@click.option("--number", default=100, show_default=True)
+@click.option("--method", default="GET", show_default=True)
+@click.option(
+    "--data",
+    multiple=True,
+    help="Form field sent with the requests, as `name=value`.",
+)
+@click.option("--email", help="Logs in as this user first.")
+@click.option("--password", default="testing", show_default=True)
+@click.option(
+    "--mode", type=click.Choice(MODES), default="sample", show_default=True
+)
+@click.option("--memory", is_flag=True, help="Records allocations as well.")
+@click.option("--output", default="profiles", show_default=True)
+def profile(  # pylint: disable=too-many-arguments
+    *,
+    target: str,
+    number: int,
+    method: str,
+    data: Tuple[str, ...],
+    email: Optional[str],
+    password: str,
+    mode: str,
+    memory: bool,
+    output: str,
+) -> None:
+    """Profiles TARGET, a path (e.g., /about) or an endpoint (bp.about)."""
+    # the rate limits would otherwise answer most of the requests
+    limiter.enabled = False
+    _profile = profile_route(
+        app,
+        target,
+        number=number,
+        method=method.upper(),
+        data=dict(item.split("=", 1) for item in data) or None,
+        login=(email, password) if email else None,
+        mode=mode,
+        memory=memory,
+    )
+    print(f"{_profile.elapsed / number * 1e3:8.2f} ms per request")
+    name = target.strip("/").replace("/", ".") or "root"
+    for path in _profile.write(output, name):
+        print(f"written: {path}")
 
 
 if __name__ == "__main__":